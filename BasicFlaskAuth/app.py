@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -104,28 +108,110 @@ def verify_decode_jwt(token):
                 'description': 'Unable to find the appropriate key.'
             }, 400)
 
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
-        abort(400)
-    if permission not in payload['permissions']:
+class TokenCache:
+    """Decoded payloads of verified tokens and their permissions, keyed by
+    the sha256 of the token and kept until the token's exp, at most max_size
+    of them (LRU).
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, token, payload, permissions=None):
+        if not isinstance(payload.get('exp'), (int, float)):
+            return
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self.lock:
+            self.entries[key] = (payload['exp'], payload, permissions)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+verified_tokens = TokenCache()
+
+
+class Requirement:
+    """The permissions a route needs: all of all_of and, if any_of isn't
+    empty, at least one of any_of.
+    """
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    def satisfied_by(self, granted):
+        return self.all_of <= granted and (not self.any_of or not self.any_of.isdisjoint(granted))
+
+
+def all_of(*permissions):
+    return Requirement(all_of=permissions)
+
+
+def any_of(*permissions):
+    return Requirement(any_of=permissions)
+
+
+def check_permissions(permission, payload, permissions=None):
+    if permissions is None:
+        if 'permissions' not in payload:
+            abort(400)
+        permissions = frozenset(payload['permissions'])
+    if not isinstance(permission, Requirement):
+        permission = Requirement(all_of=(permission,))
+    if not permission.satisfied_by(permissions):
         abort(403)
     return True 
 
 def requires_auth(permission=''):
+    if not isinstance(permission, Requirement):
+        permission = Requirement(all_of=(permission,))
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            try:
-                payload = verify_decode_jwt(token)
-            except:
-                abort(401)
-            check_permissions(permission, payload)
+            cached = verified_tokens.get(token)
+            if cached is None:
+                try:
+                    payload = verify_decode_jwt(token)
+                except:
+                    abort(401)
+                permissions = frozenset(payload['permissions']) if 'permissions' in payload else None
+                verified_tokens.put(token, payload, permissions)
+            else:
+                payload, permissions = cached
+            check_permissions(permission, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
     return requires_auth_decorator
 
+@app.route('/metrics/auth')
+def auth_metrics():
+    """Hit and miss counts of the verified token cache, for operators.
+    """
+    return json.dumps(verified_tokens.stats())
+
+
 @app.route('/image')
 @requires_auth('get:images')
 def images(jwt):
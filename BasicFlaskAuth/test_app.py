@@ -0,0 +1,57 @@
+import json
+import time
+import unittest
+from unittest import mock
+from werkzeug.exceptions import Forbidden
+
+from app import app, TokenCache, all_of, any_of, check_permissions
+import app as basic_auth
+
+
+class BasicFlaskAuthTestCase(unittest.TestCase):
+    """Token cache and permission checks, without calling Auth0"""
+
+    def setUp(self):
+        patch = mock.patch.object(basic_auth, 'verified_tokens', TokenCache(10))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = app.test_client
+
+    def test_token_cache_hit_until_expiry(self):
+        cache = TokenCache(10)
+        payload = {'exp': time.time() + 60, 'permissions': ['get:images']}
+        cache.put('token', payload, frozenset(payload['permissions']))
+        self.assertEqual(cache.get('token'), (payload, frozenset(['get:images'])))
+        cache.put('old token', {'exp': time.time() - 1})
+        self.assertIsNone(cache.get('old token'))
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+    def test_all_of_any_of(self):
+        payload = {'permissions': ['get:images', 'post:images']}
+        self.assertTrue(check_permissions(all_of('get:images', 'post:images'), payload))
+        self.assertTrue(check_permissions(any_of('delete:images', 'get:images'), payload))
+        with self.assertRaises(Forbidden):
+            check_permissions(all_of('get:images', 'delete:images'), payload)
+        with self.assertRaises(Forbidden):
+            check_permissions(any_of('delete:images'), payload)
+
+    def test_cached_token_skips_verification(self):
+        payload = {'exp': time.time() + 60, 'permissions': ['get:images']}
+        basic_auth.verified_tokens.put('token', payload, frozenset(payload['permissions']))
+        with mock.patch.object(basic_auth, 'verify_decode_jwt') as verify:
+            res = self.client().get('/image', headers={'Authorization': 'Bearer token'})
+            verify.assert_not_called()
+        self.assertEqual(res.status_code, 200)
+        stats = json.loads(self.client().get('/metrics/auth').data)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_cached_token_without_permission(self):
+        payload = {'exp': time.time() + 60, 'permissions': ['post:images']}
+        basic_auth.verified_tokens.put('token', payload, frozenset(payload['permissions']))
+        res = self.client().get('/image', headers={'Authorization': 'Bearer token'})
+        self.assertEqual(res.status_code, 403)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
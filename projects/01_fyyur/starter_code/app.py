@@ -4,17 +4,18 @@
 
 import json
 import sys
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime
+from formatting import format_datetime, format_datetimes
+from datetime import datetime, timedelta
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -26,26 +27,64 @@ db = SQLAlchemy(app)
 
 # TODO: connect to a local postgresql database
 migrate = Migrate(app, db)
+
+SHOWS_PER_PAGE = 60
+MAX_SHOWS_PER_PAGE = 500
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 from models import *
+from search import find_venues, find_artists
+import counters
+from cache import page_cache
+page_cache.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def split_shows(shows, now=None):
+  # splits shows into (past, upcoming) against a single timestamp so a show
+  # can never end up in both lists or in neither
+  now = now or datetime.now()
+  past, upcoming = [], []
+  for show in sorted(shows, key=lambda show: show.start_time):
+    if show.start_time > now:
+      upcoming.append(show)
+    else:
+      past.append(show)
+  return past, upcoming
+
+def stream_template(template_name, **context):
+  # renders the template chunk by chunk instead of building the page in memory
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return template.generate(context)
+
+def parse_date(value):
+  try:
+    return datetime.strptime(value, '%Y-%m-%d')
+  except (TypeError, ValueError):
+    return None
+
+def show_cursor(show):
+  # keyset cursor for the /shows listing: the sort key of the last row served
+  return '{}_{}'.format(show.start_time.isoformat(), show.id)
+
+def parse_show_cursor(value):
+  try:
+    start_time, id = value.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(id)
+  except (AttributeError, ValueError):
+    return None
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -59,6 +98,7 @@ def index():
 #  ----------------------------------------------------------------
 #Done
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
@@ -66,29 +106,28 @@ def venues():
   error = False
   data = []
   try:
-    venue_records = db.session.query(Venue).all()
-    locations = [(record.city, record.state) for record in venue_records]
-    unique_locations = set(locations)  
-    for location in unique_locations:
-      location_data = {}
-      location_data["city"] = location[0]
-      location_data["state"] = location[1]
-      location_data["venues"]=[]
-      data.append(location_data)
-    
+    # one round trip: every venue with its (maintained) upcoming show count,
+    # already ordered by area so the grouping below is a single pass
+    venue_records = db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).order_by(Venue.state, Venue.city, Venue.id).all()
+
+    areas = {}
     for record in venue_records:
-      for dictionary in data:
-        if dictionary["city"] == record.city and dictionary["state"] == record.state:
-          upcoming_shows = Show.query.filter_by(venue_id = record.id).filter(Show.start_time > datetime.now()).count()
-          dictionary["venues"].append({"id": record.id, "name": record.name, 
-          "num_upcoming_shows": upcoming_shows}) 
-  
+      location = (record.city, record.state)
+      if location not in areas:
+        areas[location] = {"city": record.city, "state": record.state, "venues": []}
+        data.append(areas[location])
+      areas[location]["venues"].append({"id": record.id, "name": record.name,
+      "num_upcoming_shows": record.num_upcoming_shows})
+
   except:
     error = True
     print(sys.exc_info())
   finally:
     db.session.close()
-  
+
   return render_template('pages/venues.html', areas=data)
 
 #Done
@@ -98,51 +137,36 @@ def search_venues():
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   search = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike("%"+search+"%")).all()
-  data = []
-  for venue in venues:
-    upcoming_shows = Show.query.filter_by(venue_id=venue.id).filter(
-        Show.start_time > datetime.now()).count()
-    data.append({"id": venue.id, "name": venue.name,
-                 "num_upcoming_shows": upcoming_shows})
-
-  response = {"count": len(data), "data": data}
+  page = request.form.get('page', 1, type=int)
+  response = find_venues(search, page)
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached('venues')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  past_shows = db.session.query(Artist, Show).join(Show).join(Venue).filter(
-    Show.venue_id == venue_id,
-    Show.artist_id == Artist.id,
-    Show.start_time < datetime.now()
-  ).all()
+  # the venue and all its shows (with their artists) in two statements
+  venue_record = Venue.query.options(
+    selectinload(Venue.shows).joinedload(Show.artist)
+  ).filter_by(id=venue_id).first_or_404()
+  past_shows, upcoming_shows = split_shows(venue_record.shows)
 
   past_shows_list = [{
-    'artist_id': artist.id,
-    "artist_name": artist.name,
-    "artist_image_link": artist.image_link,
-    "start_time": show.start_time.strftime('%m/%d/%Y')
-  } for artist, show in past_shows]
-
-  upcoming_shows = db.session.query(Artist, Show).join(Show).join(Venue).filter(
-      Show.venue_id == venue_id,
-      Show.artist_id == Artist.id,
-      Show.start_time > datetime.now()
-  ).all()
+    'artist_id': show.artist.id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": show.start_time
+  } for show in past_shows]
 
   upcoming_shows_list = [{
-      'artist_id': artist.id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time.strftime('%m/%d/%Y')
-  } for artist, show in upcoming_shows]
-  
-  
-  
-  venue_record = Venue.query.get(venue_id)
+      'artist_id': show.artist.id,
+      "artist_name": show.artist.name,
+      "artist_image_link": show.artist.image_link,
+      "start_time": show.start_time
+  } for show in upcoming_shows]
+
   data = {
     "id": venue_id,
     "name": venue_record.name,
@@ -202,6 +226,7 @@ def create_venue_submission():
     )
     db.session.add(new_venue)
     db.session.commit()
+    page_cache.invalidate('venues')
     
   except:
     error = True 
@@ -229,8 +254,9 @@ def delete_venue(venue_id):
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error = False
   try:
-    Venue.query.get(venue_id).delete()
+    db.session.delete(Venue.query.get(venue_id))
     db.session.commit()
+    page_cache.invalidate('venues', 'artists')
   except:
     error = True
     print(sys.exc_info())
@@ -247,6 +273,7 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 #Done
 @app.route('/artists')
+@page_cache.cached('artists')
 def artists():
   # TODO: replace with real data returned from querying the database
   artists_query = db.session.query(Artist.id, Artist.name).all()
@@ -260,49 +287,36 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   term = request.form.get('search_term', '')
-  search = '%{}%'.format(term)
-  artists = db.session.query(Artist.id, Artist.name).filter(Artist.name.ilike(search)).all()
-  _data = [artist._asdict() for artist in artists]
-  data = []
-  for _d in _data:
-    _d["num_upcoming_shows"] = db.session.query(Show).join(Artist).filter(Artist.id == _d['id'],Show.artist_id == Artist.id,
-    Show.start_time > datetime.now()).count()
-    data.append(_d)
-  response ={"count": len(data), "data": data}
+  page = request.form.get('page', 1, type=int)
+  response = find_artists(term, page)
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 #Done
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached('artists')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
   
-  past_shows = db.session.query(Venue, Show).join(Show).join(Artist).filter(
-    Show.artist_id == artist_id,
-    Show.venue_id == Venue.id, 
-    Show.start_time < datetime.now()
-  ).all()
+  # the artist and all its shows (with their venues) in two statements
+  artist_record = Artist.query.options(
+    selectinload(Artist.shows).joinedload(Show.venue)
+  ).filter_by(id=artist_id).first_or_404()
+  past_shows, upcoming_shows = split_shows(artist_record.shows)
 
   past_shows_list = [{
-    'venue_id': artist_id,
-    'venue_name': venue.name,
-    'venue_image_link': venue.image_link,
-    'start_time': show.start_time.strftime('%m/%d/%Y')
-  } for venue, show in past_shows]
-  
-  upcoming_shows = db.session.query(Venue, Show).join(Show).join(Artist).filter(
-    Show.artist_id == artist_id,
-    Show.venue_id == Venue.id,
-    Show.start_time > datetime.now()
-  ).all()
-  
+    'venue_id': show.venue.id,
+    'venue_name': show.venue.name,
+    'venue_image_link': show.venue.image_link,
+    'start_time': show.start_time
+  } for show in past_shows]
+
   upcoming_shows_list = [{
-    'venue_id': artist_id,
-    'venue_name': venue.name,
-    'venue_image_link': venue.image_link,
-    'start_time': show.start_time.strftime('%m/%d/%Y')
-  } for venue, show in upcoming_shows]
+    'venue_id': show.venue.id,
+    'venue_name': show.venue.name,
+    'venue_image_link': show.venue.image_link,
+    'start_time': show.start_time
+  } for show in upcoming_shows]
 
-  artist_record = Artist.query.get(artist_id)
   data = {
     "id": artist_record.id,
     "name": artist_record.name,
@@ -318,8 +332,8 @@ def show_artist(artist_id):
     "past_shows" : past_shows_list,
     "upcoming_shows" : upcoming_shows_list,
     "past_shows_count" : len(past_shows_list),
-    "upcoming_shows_count" : len(past_shows_list)
-  } 
+    "upcoming_shows_count" : len(upcoming_shows_list)
+  }
 
   return render_template('pages/show_artist.html', artist=data)
 
@@ -349,6 +363,7 @@ def edit_artist_submission(artist_id):
     artist = Artist.query.first_or_404(artist_id)
     form.populate_obj(artist)    
     db.session.commit()
+    page_cache.invalidate('artists', 'venues')
   except:
     error = True
     db.session.rollback()
@@ -380,6 +395,7 @@ def edit_venue_submission(venue_id):
     venue = Venue.query.first_or_404(venue_id)
     form.populate_obj(venue)
     db.session.commit()
+    page_cache.invalidate('venues', 'artists')
   except:
     error = True
     db.session.rollback()
@@ -413,6 +429,7 @@ def create_artist_submission():
     form.populate_obj(new_artist)
     db.session.add(new_artist)
     db.session.commit()
+    page_cache.invalidate('artists')
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
   except:
@@ -441,17 +458,56 @@ def shows():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
   
-  shows = db.session.query(Show).all()
-  data = [{
-    "venue_id": show.venue_id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist_id,
-    "artist_name":show.artist.name,
-    "artist_image_link":show.artist.image_link,
-    "start_time": show.start_time.strftime("%Y%m%d")
-  }for show in shows]
-
-  return render_template('pages/shows.html', shows=data)
+  # one keyset page of shows, oldest first, with the venue and artist
+  # names joined in so no relationship is loaded per row
+  filters = {}
+  query = db.session.query(
+    Show.id, Show.start_time, Show.venue_id, Show.artist_id,
+    Venue.name.label('venue_name'),
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link')
+  ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+  for arg, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+    value = request.args.get(arg, type=int)
+    if value is not None:
+      filters[arg] = value
+      query = query.filter(column == value)
+  start = parse_date(request.args.get('from'))
+  if start is not None:
+    filters['from'] = request.args['from']
+    query = query.filter(Show.start_time >= start)
+  until = parse_date(request.args.get('until'))
+  if until is not None:
+    filters['until'] = request.args['until']
+    # the end date is inclusive, so stop at the next midnight
+    query = query.filter(Show.start_time < until + timedelta(days=1))
+
+  cursor = parse_show_cursor(request.args.get('after'))
+  if cursor:
+    query = query.filter(tuple_(Show.start_time, Show.id) > cursor)
+  limit = min(max(request.args.get('limit', SHOWS_PER_PAGE, type=int), 1), MAX_SHOWS_PER_PAGE)
+  rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+  db.session.close()
+
+  next_url = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_url = url_for('shows', after=show_cursor(rows[-1]), limit=limit, **filters)
+
+  start_times = format_datetimes((row.start_time for row in rows), 'full')
+  data = ({
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": row.start_time,
+    "start_time_display": start_time
+  } for row, start_time in zip(rows, start_times))
+
+  return Response(stream_with_context(
+    stream_template('pages/shows.html', shows=data, filters=filters, next_url=next_url)))
 
 @app.route('/shows/create')
 def create_shows():
@@ -471,6 +527,7 @@ def create_show_submission():
     form.populate_obj(new_show)
     db.session.add(new_show)
     db.session.commit()
+    page_cache.invalidate('venues', 'artists')
     flash('Show was successfully listed!')
   except:
     error = True
@@ -486,6 +543,13 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics/cache')
+def cache_metrics():
+  return Response(page_cache.metrics(), mimetype='text/plain')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,232 @@
+"""
+Page and fragment cache for the read heavy pages.
+
+Entries are keyed on the route path and its query string and grouped in
+namespaces ('venues', 'artists'). Every namespace has a version
+number stored in the backend next to the entries; writes call
+page_cache.invalidate(namespace), which bumps the version so every key built
+from the old one is never looked up again, and removes the entries of the old
+version from the backend. Expired entries are removed when they are read, and
+the filesystem backend also sweeps them out every CACHE_SWEEP_INTERVAL seconds.
+
+Streamed responses are passed through and never cached, caching them would
+mean buffering the whole page first. That is why /shows isn't cached.
+
+Two backends are available, picked with CACHE_BACKEND in config.py:
+    'lru'         in-process, bounded by CACHE_MAX_ENTRIES
+    'filesystem'  pickled files under CACHE_DIR, shared between workers
+"""
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response, Response
+
+
+def expired(expires):
+    return expires is not None and expires <= time.time()
+
+
+class LRUBackend(object):
+    """Bounded in-process store, least recently used entries go first."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            expires, value = self.entries[key]
+            if expired(expires):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.entries[key] = (time.time() + timeout if timeout else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend(object):
+    """One pickle file per key in directory.
+
+    Each file starts with a small (expires, key) header pickled ahead of the
+    value, so sweeps can decide what to remove without loading whole pages.
+    """
+
+    def __init__(self, directory, sweep_interval=60):
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        self.swept_at = time.time()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, _ = pickle.load(f)
+                if not expired(expires):
+                    return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self.unlink(path)
+        return None
+
+    def set(self, key, value, timeout=None):
+        # write to a temporary file first so readers never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + timeout if timeout else None, key), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        if time.time() - self.swept_at >= self.sweep_interval:
+            self.sweep()
+
+    def unlink(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def sweep(self, prefix=None):
+        """Removes the expired entries, and the ones whose key starts with prefix."""
+        self.swept_at = time.time()
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    expires, key = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+                self.unlink(path)
+                continue
+            if not isinstance(key, str) or expired(expires) or (prefix is not None and key.startswith(prefix)):
+                self.unlink(path)
+
+    def delete_prefix(self, prefix):
+        self.sweep(prefix)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self.unlink(os.path.join(self.directory, name))
+
+
+class PageCache(object):
+
+    def __init__(self, backend=None, timeout=300):
+        self.backend = backend or LRUBackend()
+        self.timeout = timeout
+        self.hits = {}
+        self.misses = {}
+        self.counter_lock = threading.Lock()
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'lru')
+        if kind == 'filesystem':
+            self.backend = FileSystemBackend(
+                app.config.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fyyur-cache')),
+                app.config.get('CACHE_SWEEP_INTERVAL', 60))
+        else:
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1000))
+        self.timeout = app.config.get('CACHE_TIMEOUT', self.timeout)
+
+    def version(self, namespace):
+        return self.backend.get('version:' + namespace) or 0
+
+    def invalidate(self, *namespaces):
+        """Drops every entry of the given namespaces."""
+        for namespace in namespaces:
+            version = self.version(namespace)
+            self.backend.set('version:' + namespace, version + 1)
+            self.backend.delete_prefix('%s:%d:' % (namespace, version))
+
+    def clear(self):
+        self.backend.clear()
+
+    def count(self, counters, namespace):
+        with self.counter_lock:
+            counters[namespace] = counters.get(namespace, 0) + 1
+
+    def lookup(self, namespace, key):
+        """Returns (full key, cached value or None)."""
+        key = '%s:%d:%s' % (namespace, self.version(namespace), key)
+        value = self.backend.get(key)
+        self.count(self.hits if value is not None else self.misses, namespace)
+        return key, value
+
+    def get_or_set(self, namespace, key, render):
+        """Returns the cached value for key, calling render() to fill it in
+        on a miss. Usable for whole pages as well as template fragments."""
+        key, value = self.lookup(namespace, key)
+        if value is None:
+            value = render()
+            self.backend.set(key, value, self.timeout)
+        return value
+
+    def cached(self, namespace):
+        """View decorator caching the rendered page and answering
+        If-None-Match with 304 Not Modified.
+
+        Pages rendered while a flash message is pending aren't cached, the
+        message belongs to one visitor only. Neither are streamed responses,
+        they are returned as they are.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if session.get('_flashes'):
+                    return f(*args, **kwargs)
+
+                key, entry = self.lookup(namespace, request.full_path)
+                if entry is None:
+                    response = make_response(f(*args, **kwargs))
+                    if response.is_streamed:
+                        return response
+                    body = response.get_data()
+                    entry = (body, response.status_code, response.mimetype,
+                             hashlib.md5(body).hexdigest())
+                    self.backend.set(key, entry, self.timeout)
+
+                body, status, mimetype, etag = entry
+                response = Response(body, status=status, mimetype=mimetype)
+                response.set_etag(etag)
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def metrics(self):
+        """Hit/miss counters in the Prometheus text format."""
+        with self.counter_lock:
+            hits, misses = sorted(self.hits.items()), sorted(self.misses.items())
+        lines = ['# TYPE fyyur_cache_hits_total counter']
+        lines += ['fyyur_cache_hits_total{namespace="%s"} %d' % item for item in hits]
+        lines += ['# TYPE fyyur_cache_misses_total counter']
+        lines += ['fyyur_cache_misses_total{namespace="%s"} %d' % item for item in misses]
+        return '\n'.join(lines) + '\n'
+
+
+page_cache = PageCache()
@@ -12,3 +12,11 @@ DEBUG = True
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = 'postgres://hamed.zoghi@localhost:5432/fyyur'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Page cache, see cache.py ('lru' or 'filesystem')
+CACHE_BACKEND = 'lru'
+CACHE_DIR = os.path.join(basedir, '.cache')
+CACHE_MAX_ENTRIES = 1000
+CACHE_TIMEOUT = 300
+# how often the filesystem backend removes expired entries, in seconds
+CACHE_SWEEP_INTERVAL = 60
@@ -0,0 +1,134 @@
+"""
+Denormalized upcoming show counters.
+Venue.upcoming_shows_count and Artist.upcoming_shows_count are kept up to date
+here so the listing pages never have to COUNT(*) the shows table:
+
+  * an upcoming show bumps both counters when it is inserted through the ORM
+    and Show.counted_upcoming remembers that it was counted,
+  * deleting a counted show (directly, or through its venue/artist) takes it
+    back off,
+  * `flask roll-shows`, run periodically (e.g. from cron), moves the shows
+    whose start time has passed from "upcoming" to "past".
+
+`flask rebuild-counters` recomputes everything from scratch, for data loaded
+around the ORM.
+"""
+from datetime import datetime
+from sqlalchemy import event, func, select, bindparam
+from app import app, db
+from models import Venue, Artist, Show
+from cache import page_cache
+
+venues = Venue.__table__
+artists = Artist.__table__
+shows = Show.__table__
+
+
+def adjust(connection, table, deltas):
+    """Adds deltas ({id: n}) to the upcoming_shows_count of table's rows."""
+    params = [{'row_id': id, 'delta': n} for id, n in deltas.items() if n]
+    if params:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + bindparam('delta')),
+            params)
+
+#--------------------------------------------------------------------
+# Session events
+#--------------------------------------------------------------------
+
+@event.listens_for(Show, 'before_insert')
+def mark_upcoming(mapper, connection, target):
+    target.counted_upcoming = target.start_time > datetime.now()
+
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, target):
+    if target.counted_upcoming:
+        adjust(connection, venues, {target.venue_id: 1})
+        adjust(connection, artists, {target.artist_id: 1})
+
+
+@event.listens_for(Show, 'before_delete')
+def lock_deleted_show(mapper, connection, target):
+    # the flag loaded with the show may be stale if roll_over_shows ran since,
+    # read it again under a row lock
+    target.counted_upcoming = connection.execute(
+        select([shows.c.counted_upcoming]).where(shows.c.id == target.id).with_for_update()).scalar()
+
+
+@event.listens_for(Show, 'after_delete')
+def uncount_deleted_show(mapper, connection, target):
+    if target.counted_upcoming:
+        adjust(connection, venues, {target.venue_id: -1})
+        adjust(connection, artists, {target.artist_id: -1})
+
+
+def uncount_cascaded_shows(own_column, other_column, other_table):
+    # shows removed by ON DELETE CASCADE never reach the ORM, so take them
+    # off the counters of whoever sat on the other side of the show
+    def before_delete(mapper, connection, target):
+        rows = connection.execute(
+            select([other_column, func.count()]).where(
+                (own_column == target.id) & shows.c.counted_upcoming
+            ).group_by(other_column))
+        adjust(connection, other_table, {id: -n for id, n in rows})
+    return before_delete
+
+
+event.listen(Venue, 'before_delete', uncount_cascaded_shows(shows.c.venue_id, shows.c.artist_id, artists))
+event.listen(Artist, 'before_delete', uncount_cascaded_shows(shows.c.artist_id, shows.c.venue_id, venues))
+
+#--------------------------------------------------------------------
+# Periodic jobs
+#--------------------------------------------------------------------
+
+def roll_over_shows(now=None):
+    """Moves every counted show that has started from "upcoming" to "past".
+
+    Only the shows that crossed the line since the last run are touched.
+
+    Returns:
+        int: number of shows rolled over
+    """
+    now = now or datetime.now()
+    started = shows.c.counted_upcoming & (shows.c.start_time <= now)
+    with db.engine.begin() as connection:
+        # one statement, so a show deleted meanwhile is either gone before
+        # the flag is cleared or sees it cleared, never counted down twice
+        rows = connection.execute(shows.update().where(started).values(
+            counted_upcoming=False).returning(shows.c.venue_id, shows.c.artist_id)).fetchall()
+        venue_deltas, artist_deltas = {}, {}
+        for venue_id, artist_id in rows:
+            venue_deltas[venue_id] = venue_deltas.get(venue_id, 0) - 1
+            artist_deltas[artist_id] = artist_deltas.get(artist_id, 0) - 1
+        adjust(connection, venues, venue_deltas)
+        adjust(connection, artists, artist_deltas)
+    if rows:
+        page_cache.invalidate('venues', 'artists')
+    return len(rows)
+
+
+def rebuild_counters(now=None):
+    """Recounts every counter from the shows table."""
+    now = now or datetime.now()
+    with db.engine.begin() as connection:
+        connection.execute(shows.update().values(counted_upcoming=shows.c.start_time > now))
+        for table, column in ((venues, shows.c.venue_id), (artists, shows.c.artist_id)):
+            upcoming = select([func.count()]).where(
+                (column == table.c.id) & shows.c.counted_upcoming).as_scalar()
+            connection.execute(table.update().values(upcoming_shows_count=upcoming))
+    page_cache.invalidate('venues', 'artists')
+
+
+@app.cli.command('roll-shows')
+def roll_shows_command():
+    """Move shows that have started out of the upcoming counters."""
+    print('%d shows rolled over' % roll_over_shows())
+
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute all upcoming show counters."""
+    rebuild_counters()
+    print('upcoming show counters rebuilt')
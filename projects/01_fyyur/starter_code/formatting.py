@@ -0,0 +1,62 @@
+"""
+Date formatting for the templates (the `datetime` Jinja filter).
+
+Views hand the filter datetime objects straight from the database, so nothing
+is re-parsed. Babel patterns are compiled once per (format, locale) and the
+most recent results are memoized, the same show times come up over and over
+on the listing and detail pages.
+"""
+from datetime import datetime
+from functools import lru_cache
+import dateutil.parser
+from babel.core import Locale
+from babel.dates import LC_TIME, UTC, parse_pattern
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format='medium', locale=None):
+    """Returns the (DateTimePattern, Locale) pair for a named format
+    ('full', 'medium') or a raw Babel pattern."""
+    return parse_pattern(FORMATS.get(format, format)), Locale.parse(locale or LC_TIME)
+
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+    """Formats a datetime (or a date string, for older callers).
+
+    Args:
+        value (datetime or str): the value to format
+        format (str, optional): 'full', 'medium' or a Babel pattern. Defaults to 'medium'.
+        locale (str, optional): locale identifier. Defaults to the system time locale.
+
+    Returns:
+        str: the formatted date
+    """
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        # same as babel.dates.format_datetime: naive values are taken as UTC
+        value = value.replace(tzinfo=UTC)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetimes(values, format='medium', locale=None):
+    """Formats a whole column of values for a list page, repeated values
+    are only formatted once.
+
+    Returns:
+        list: the formatted values, in order
+    """
+    formatted = {}
+    results = []
+    for value in values:
+        if value not in formatted:
+            formatted[value] = format_datetime(value, format, locale)
+        results.append(formatted[value])
+    return results
@@ -0,0 +1,34 @@
+"""Search indexes
+
+Revision ID: a3c1f9d27b64
+Revises: 5de586cc4f0b
+Create Date: 2026-10-18 10:12:41.301552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f9d27b64'
+down_revision = '5de586cc4f0b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venues', 'artists'):
+        for column in ('name', 'city'):
+            op.create_index('ix_%s_%s_trgm' % (table, column), table, [column],
+                            postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+        op.create_index('ix_%s_genres' % table, table, ['genres'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_index('ix_%s_genres' % table, table_name=table)
+        for column in ('name', 'city'):
+            op.drop_index('ix_%s_%s_trgm' % (table, column), table_name=table)
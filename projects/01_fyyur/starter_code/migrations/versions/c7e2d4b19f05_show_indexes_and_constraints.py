@@ -0,0 +1,46 @@
+"""Show indexes and constraints
+
+Revision ID: c7e2d4b19f05
+Revises: a3c1f9d27b64
+Create Date: 2026-10-18 11:04:27.518930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2d4b19f05'
+down_revision = 'a3c1f9d27b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a show without an artist, a venue or a start time can't be listed anywhere
+    op.execute('DELETE FROM shows WHERE artist_id IS NULL OR venue_id IS NULL OR start_time IS NULL')
+    op.alter_column('shows', 'artist_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('shows', 'venue_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('shows', 'start_time', existing_type=sa.DateTime(), nullable=False)
+
+    op.drop_constraint('shows_artist_id_fkey', 'shows', type_='foreignkey')
+    op.drop_constraint('shows_venue_id_fkey', 'shows', type_='foreignkey')
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues', ['venue_id'], ['id'], ondelete='CASCADE')
+
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+
+    op.drop_constraint('shows_venue_id_fkey', 'shows', type_='foreignkey')
+    op.drop_constraint('shows_artist_id_fkey', 'shows', type_='foreignkey')
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists', ['artist_id'], ['id'])
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues', ['venue_id'], ['id'])
+
+    op.alter_column('shows', 'start_time', existing_type=sa.DateTime(), nullable=True)
+    op.alter_column('shows', 'venue_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('shows', 'artist_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,39 @@
+"""Upcoming show counters
+
+Revision ID: d91f3a6c2e48
+Revises: c7e2d4b19f05
+Create Date: 2026-10-18 12:31:09.742115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f3a6c2e48'
+down_revision = 'c7e2d4b19f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('artists', sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('shows', sa.Column('counted_upcoming', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index('ix_shows_counted_upcoming_start_time', 'shows', ['start_time'],
+                    postgresql_where=sa.text('counted_upcoming'))
+
+    # backfill, the same thing `flask rebuild-counters` does
+    op.execute('UPDATE shows SET counted_upcoming = start_time > LOCALTIMESTAMP')
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(
+            'UPDATE {table} SET upcoming_shows_count = ('
+            'SELECT COUNT(*) FROM shows WHERE shows.{column} = {table}.id AND shows.counted_upcoming)'
+            .format(table=table, column=column))
+
+
+def downgrade():
+    op.drop_index('ix_shows_counted_upcoming_start_time', table_name='shows')
+    op.drop_column('shows', 'counted_upcoming')
+    op.drop_column('artists', 'upcoming_shows_count')
+    op.drop_column('venues', 'upcoming_shows_count')
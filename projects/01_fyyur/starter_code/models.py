@@ -1,9 +1,22 @@
 from app import db
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import ARRAY
+
+
+def trigram_index(table, column):
+    # GIN trigram index backing the ranked ILIKE search in search.py
+    return db.Index('ix_%s_%s_trgm' % (table, column), column,
+                    postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
 
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        trigram_index('venues', 'name'),
+        trigram_index('venues', 'city'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -15,11 +28,14 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    # maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='venue', lazy=True,
+                            cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return "Venue id: " + str(self.id) + "name: " + self.name
@@ -27,13 +43,18 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        trigram_index('artists', 'name'),
+        trigram_index('artists', 'city'),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -41,20 +62,40 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    # maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='artist', lazy=True,
+                            cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return "Artist id: " + str(self.id) + "name: " + self.name
 
 
+# the trigram indexes need pg_trgm, make sure db.create_all() sets it up too
+for table in (Venue.__table__, Artist.__table__):
+    event.listen(table, 'before_create',
+                 DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
 class Show(db.Model):
   __tablename__ = 'shows'
+  # every past/upcoming lookup filters on one side of the relationship and
+  # then on start_time, so both composite indexes lead with the foreign key
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # the shows `flask roll-shows` still has to move from upcoming to past
+    db.Index('ix_shows_counted_upcoming_start_time', 'start_time',
+             postgresql_where=db.text('counted_upcoming')),
+  )
   id = db.Column(db.Integer, primary_key=True)
-  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'))
-  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'))
-  start_time = db.Column(db.DateTime)
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
+  start_time = db.Column(db.DateTime, nullable=False)
+  # whether the show is included in its venue's/artist's upcoming_shows_count
+  counted_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
 def __repr__(self):
     log = "Show id: " + str(self.id) + "artist_id: " + str(self.artist_id)
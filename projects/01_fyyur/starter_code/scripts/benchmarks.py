@@ -0,0 +1,184 @@
+"""
+Benchmarks for the read heavy Fyyur pages.
+They run against a scratch database (never the real one) since the tables are
+dropped and re-seeded with synthetic data before measuring.
+
+    FYYUR_BENCH_DATABASE_URI=postgres://localhost:5432/fyyur_bench \\
+        python scripts/benchmarks.py venues
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import app, db
+from models import Venue, Artist, Show
+from search import find_venues
+from counters import rebuild_counters
+from cache import page_cache
+
+BENCH_DATABASE_URI = os.environ.get(
+    'FYYUR_BENCH_DATABASE_URI', 'postgres://localhost:5432/fyyur_bench')
+BATCH_SIZE = 10000
+
+#--------------------------------------------------------------------
+# Helpers
+#--------------------------------------------------------------------
+
+@contextmanager
+def count_queries():
+    """Collects every statement sent to the database inside the block.
+
+    Yields:
+        list: the SQL statements, filled in as they are executed
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def insert_in_batches(table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def seed(num_venues, num_artists, num_shows):
+    """Drops the bench tables and fills them with synthetic rows."""
+    db.drop_all()
+    db.create_all()
+    cities = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'),
+              ('Seattle', 'WA'), ('Chicago', 'IL'), ('Boston', 'MA')]
+    insert_in_batches(Venue.__table__, ({
+        'id': i,
+        'name': 'Venue %d' % i,
+        'city': cities[i % len(cities)][0],
+        'state': cities[i % len(cities)][1],
+        'genres': ['Jazz'],
+    } for i in range(1, num_venues + 1)))
+    insert_in_batches(Artist.__table__, ({
+        'id': i,
+        'name': 'Artist %d' % i,
+        'genres': ['Jazz'],
+    } for i in range(1, num_artists + 1)))
+    now = datetime.now()
+    insert_in_batches(Show.__table__, ({
+        'artist_id': random.randint(1, num_artists),
+        'venue_id': random.randint(1, num_venues),
+        'start_time': now + timedelta(hours=random.randint(-24 * 365, 24 * 365)),
+    } for _ in range(num_shows)))
+    # the rows above went around the ORM events
+    rebuild_counters()
+
+
+def timed_get(client, url, max_queries, label=None):
+    with count_queries() as statements:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.status_code
+    print('%-30s %8.3fs %4d queries' % (label or url, elapsed, len(statements)))
+    assert len(statements) <= max_queries, \
+        '%s issued %d queries, ceiling is %d' % (url, len(statements), max_queries)
+
+#--------------------------------------------------------------------
+# Benchmarks
+#--------------------------------------------------------------------
+
+def bench_venues(args):
+    seed(args.venues, args.artists, args.shows)
+    client = app.test_client()
+    for _ in range(args.repeat):
+        # measure the query path, not the page cache
+        page_cache.clear()
+        timed_get(client, '/venues', max_queries=1)
+    for _ in range(args.repeat):
+        timed_get(client, '/venues', max_queries=0, label='/venues (cached)')
+
+
+def bench_search(args):
+    """Compares the ranked, index backed search with the old ilike scan."""
+    seed(args.venues, args.artists, args.shows)
+    terms = ['Venue 12', 'venue 4999', 'San', 'jazz', 'no such venue']
+    for term in terms:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            db.session.query(Venue.id, Venue.name).filter(
+                Venue.name.ilike('%{}%'.format(term))).all()
+        ilike = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = find_venues(term)
+        ranked = (time.perf_counter() - start) / args.repeat
+        print('%-15s ilike %8.4fs  ranked %8.4fs  %6d matches' % (term, ilike, ranked, result['count']))
+
+
+def bench_datetime_filter(args):
+    """Per-row cost of the `datetime` template filter, old and new."""
+    import babel.dates
+    import dateutil.parser
+    from formatting import format_datetime, format_datetimes
+
+    def old_filter(value, format='medium'):
+        date = dateutil.parser.parse(value)
+        if format == 'full':
+            format = "EEEE MMMM, d, y 'at' h:mma"
+        elif format == 'medium':
+            format = "EE MM, dd, y h:mma"
+        return babel.dates.format_datetime(date, format)
+
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    values = [now + timedelta(hours=random.randint(-24 * 365, 24 * 365)) for _ in range(args.rows)]
+    strings = [value.strftime('%Y%m%d') for value in values]
+    runs = [
+        ('string + parse (old)', lambda: [old_filter(value, 'full') for value in strings]),
+        ('datetime, per row', lambda: [format_datetime(value, 'full') for value in values]),
+        ('datetime, batch', lambda: format_datetimes(values, 'full')),
+    ]
+    for name, run in runs:
+        format_datetime.cache_clear()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            run()
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print('%-22s %8.2f us/row' % (name, elapsed / args.rows * 1e6))
+
+
+BENCHMARKS = {
+    'venues': bench_venues,
+    'search': bench_search,
+    'datetime-filter': bench_datetime_filter,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--venues', type=int, default=50000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=500000)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = BENCH_DATABASE_URI
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args)
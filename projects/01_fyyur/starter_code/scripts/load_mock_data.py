@@ -1,6 +1,12 @@
 """
-Scripts to load the mock data into the database
+Scripts to load the mock data, or synthetic data at any scale, into the database
 The mock data is extracted from the existing forms
+
+    python scripts/load_mock_data.py mock
+    python scripts/load_mock_data.py synthetic --venues 20000 --artists 50000 --shows 1000000
+
+Rows are sent in batches (execute_values for venues/artists, COPY FROM STDIN
+for shows) with one transaction per table, and the load rate is reported.
 """
 #--------------------------------------------------------------------
 # Venue - mock data
@@ -127,45 +133,220 @@ sdata5 = {
 shows = [sdata1, sdata2, sdata3, sdata4]
 
 #--------------------------------------------------------
+# Loader
+#--------------------------------------------------------
+import io
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+from itertools import islice
+from datetime import datetime, timedelta
 import psycopg2, psycopg2.extras
 
-def load_table(table_name = 'test_table', data_list=[{"A": 1, "B": "2"}, {"A": 10, "B": "20"}]):
-    """This function takes the name of the table as a string along with the list of records 
-    and persists it in the exiting tables in the db
+BATCH_SIZE = 10000
+
+
+def default_dsn():
+    if 'FYYUR_DATABASE_URI' in os.environ:
+        return os.environ['FYYUR_DATABASE_URI']
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import SQLALCHEMY_DATABASE_URI
+    return SQLALCHEMY_DATABASE_URI
+
+
+def batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+def report(table_name, count, started):
+    elapsed = time.perf_counter() - started
+    print("%-8s %10d rows in %7.2fs  %10.0f rows/sec" % (
+        table_name, count, elapsed, count / elapsed if elapsed else 0))
+
+
+def load_table(conn, table_name, data_list, keep_ids=False, batch_size=BATCH_SIZE):
+    """This function takes the name of the table as a string along with the records
+    and persists them in the existing table with batched execute_values calls
+    inside a single transaction
 
     Args:
-        table_name (str, optional):
-            name of the table in the database.
-            Defaults to 'test_table'.
-        data_list (list, optional):
-            List of dictionaries where each dictionary is a record.
-            Defaults to [{"A": 1, "B": "2"}, {"A": 10, "B": "20"}].
+        conn: an open psycopg2 connection
+        table_name (str): name of the table in the database.
+        data_list (iterable): dictionaries where each dictionary is a record,
+            all sharing the same keys. The dictionaries are not modified.
+        keep_ids (bool, optional): insert the "id" key as well instead of
+            letting the database assign ids. Defaults to False.
+        batch_size (int, optional): rows per statement. Defaults to BATCH_SIZE.
+
+    Returns:
+        int: number of rows inserted
     """
-    #modify this line to match your database credentials
-    conn = psycopg2.connect(dbname="not_fyyur", user="none")
-    
-    cur = conn.cursor()
-    for d in data_list:
-        keys = []
-        values = []
-        d.pop("id")
-        for key, value in d.items():
-            keys.append(key)
-            values.append(value)
-        keys_str = ','.join(str(x) for x in keys)
-        values_tuple = tuple(values)
-        percents = ','.join(['%s']*len(keys))
-        sql_binding = "INSERT INTO %s (%s) VALUES (%s);" %(table_name, keys_str, percents)
-        insert = cur.mogrify(sql_binding, values_tuple)
-        cur.execute(insert)
+    started = time.perf_counter()
+    count = 0
+    with conn.cursor() as cur:
+        for batch in batches(data_list, batch_size):
+            # the mock records don't all carry the same keys, missing ones load as NULL
+            keys = []
+            for d in batch:
+                keys.extend(key for key in d if key not in keys and (keep_ids or key != "id"))
+            sql_binding = "INSERT INTO %s (%s) VALUES %%s" % (table_name, ','.join(keys))
+            psycopg2.extras.execute_values(
+                cur, sql_binding, [tuple(d.get(key) for key in keys) for d in batch],
+                page_size=len(batch))
+            count += len(batch)
+        if keep_ids:
+            reset_sequence(cur, table_name)
+    conn.commit()
+    report(table_name, count, started)
+    return count
+
+
+def copy_table(conn, table_name, columns, rows, batch_size=BATCH_SIZE):
+    """Streams tuples of plain values (no arrays) into table_name with
+    COPY FROM STDIN, batch by batch, inside a single transaction
 
+    Returns:
+        int: number of rows copied
+    """
+    started = time.perf_counter()
+    count = 0
+    sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table_name, ','.join(columns))
+    with conn.cursor() as cur:
+        for batch in batches(rows, batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+            count += len(batch)
+        if 'id' in columns:
+            reset_sequence(cur, table_name)
     conn.commit()
-    cur.close()
-    conn.close()
-    return
+    report(table_name, count, started)
+    return count
+
+
+def reset_sequence(cur, table_name):
+    # explicit ids bypass the serial sequence, move it past them
+    cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                "(SELECT COALESCE(MAX(id), 0) + 1 FROM " + table_name + "), false)",
+                (table_name,))
+
+
+def max_id(conn, table_name):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM " + table_name)
+        return cur.fetchone()[0]
+
+#--------------------------------------------------------
+# Synthetic data
+#--------------------------------------------------------
+CITIES = [("San Francisco", "CA"), ("New York", "NY"), ("Austin", "TX"), ("Seattle", "WA"),
+          ("Chicago", "IL"), ("Boston", "MA"), ("Nashville", "TN"), ("Denver", "CO")]
+GENRES = ["Alternative", "Blues", "Classical", "Country", "Electronic", "Folk", "Funk",
+          "Hip-Hop", "Heavy Metal", "Instrumental", "Jazz", "Musical Theatre", "Pop",
+          "Punk", "R&B", "Reggae", "Rock n Roll", "Soul", "Swing", "Other"]
+
+
+def synthetic_venues(first_id, count):
+    for id in range(first_id, first_id + count):
+        city, state = random.choice(CITIES)
+        yield {
+            "id": id,
+            "name": "Venue %d" % id,
+            "genres": random.sample(GENRES, random.randint(1, 3)),
+            "address": "%d Main Street" % random.randint(1, 9999),
+            "city": city,
+            "state": state,
+            "phone": "555-%03d-%04d" % (random.randint(0, 999), random.randint(0, 9999)),
+            "seeking_talent": random.random() < 0.5,
+        }
+
+
+def synthetic_artists(first_id, count):
+    for id in range(first_id, first_id + count):
+        city, state = random.choice(CITIES)
+        yield {
+            "id": id,
+            "name": "Artist %d" % id,
+            "genres": random.sample(GENRES, random.randint(1, 2)),
+            "city": city,
+            "state": state,
+            "phone": "555-%03d-%04d" % (random.randint(0, 999), random.randint(0, 9999)),
+            "seeking_venue": random.random() < 0.5,
+        }
+
+
+def synthetic_shows(venue_ids, artist_ids, count, days=365):
+    """Yields (artist_id, venue_id, start_time) tuples spread over +/- days from now."""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    for _ in range(count):
+        yield (random.randint(*artist_ids), random.randint(*venue_ids),
+               (now + timedelta(hours=random.randint(-24 * days, 24 * days))).isoformat())
+
+
+def load_synthetic(conn, num_venues, num_artists, num_shows):
+    first_venue = max_id(conn, "venues") + 1
+    first_artist = max_id(conn, "artists") + 1
+    load_table(conn, "venues", synthetic_venues(first_venue, num_venues), keep_ids=True)
+    load_table(conn, "artists", synthetic_artists(first_artist, num_artists), keep_ids=True)
+    copy_table(conn, "shows", ("artist_id", "venue_id", "start_time"), synthetic_shows(
+        (first_venue, first_venue + num_venues - 1),
+        (first_artist, first_artist + num_artists - 1), num_shows))
+    rebuild_counters(conn)
+
+
+def rebuild_counters(conn):
+    """Recomputes the upcoming show counters (see counters.py) for the rows
+    loaded around the app."""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute("UPDATE shows SET counted_upcoming = start_time > LOCALTIMESTAMP")
+        for table, column in (("venues", "venue_id"), ("artists", "artist_id")):
+            cur.execute(
+                "UPDATE {table} SET upcoming_shows_count = COALESCE(counts.n, 0) FROM {table} t "
+                "LEFT JOIN (SELECT {column}, COUNT(*) AS n FROM shows WHERE counted_upcoming "
+                "GROUP BY {column}) counts ON counts.{column} = t.id "
+                "WHERE {table}.id = t.id".format(table=table, column=column))
+    conn.commit()
+    print("counters rebuilt in %.2fs" % (time.perf_counter() - started))
+
+
+def load_mock(conn):
+    load_table(conn, "venues", venues)
+    load_table(conn, "artists", artists)
+    load_table(conn, "shows", shows)
+    rebuild_counters(conn)
+
 
-#If you ar running this file directly uncoment the following three lines to call the function
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the fyyur database.")
+    parser.add_argument("--dsn", default=None,
+                        help="database URI, defaults to $FYYUR_DATABASE_URI or config.py")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    commands.add_parser("mock", help="load the mock venues, artists and shows")
+    synthetic = commands.add_parser("synthetic", help="generate and load synthetic rows")
+    synthetic.add_argument("--venues", type=int, default=10000)
+    synthetic.add_argument("--artists", type=int, default=10000)
+    synthetic.add_argument("--shows", type=int, default=1000000)
+    synthetic.add_argument("--seed", type=int, default=None, help="random seed for repeatable data")
+    args = parser.parse_args()
 
-#load_table("venues", venues)
-#load_table("artists", artists)
-#load_table("shows", shows)
+    conn = psycopg2.connect(args.dsn or default_dsn())
+    try:
+        if args.command == "mock":
+            load_mock(conn)
+        else:
+            random.seed(args.seed)
+            if min(args.venues, args.artists) < 1 and args.shows:
+                parser.error("shows need at least one venue and one artist")
+            load_synthetic(conn, args.venues, args.artists, args.shows)
+    finally:
+        conn.close()
@@ -0,0 +1,80 @@
+"""
+Search helpers shared by the venue and artist search pages.
+A search only ever loads one page of matches, and the upcoming show counts
+come straight from the counters maintained by counters.py.
+
+Matches are looked up on name, city and genres and ranked by trigram
+similarity to the search term, against the pg_trgm GIN indexes (see
+migrations/versions/a3c1f9d27b64_search_indexes.py). Like the rest of the
+models (ARRAY genres), this needs PostgreSQL.
+"""
+from sqlalchemy import func, or_, case
+from app import db
+from models import Venue, Artist
+from forms import genre_choices
+
+RESULTS_PER_PAGE = 20
+GENRE_MATCH_RANK = 0.5
+
+
+def matching_genres(term):
+    """Returns the known genres whose name contains term (case-insensitive)."""
+    term = term.lower()
+    return [genre for genre, _ in genre_choices if term and term in genre.lower()]
+
+#--------------------------------------------------------------------
+# Search
+#--------------------------------------------------------------------
+
+def ranked_matches(model, term, per_page, offset):
+    """Returns (total, rows) for one page of ranked matches, each row holding
+    the id, name and upcoming_shows_count of a match."""
+    genres = matching_genres(term)
+    pattern = '%{}%'.format(term)
+    conditions = [model.name.ilike(pattern), model.city.ilike(pattern)]
+    rank = func.greatest(func.similarity(model.name, term), func.similarity(model.city, term))
+    if genres:
+        genre_match = model.genres.overlap(genres)
+        conditions.append(genre_match)
+        rank = func.greatest(rank, case([(genre_match, GENRE_MATCH_RANK)], else_=0))
+    matches = db.session.query(model.id, model.name, model.upcoming_shows_count).filter(or_(*conditions))
+    total = matches.count()
+    rows = matches.order_by(rank.desc(), model.name, model.id).limit(per_page).offset(offset).all()
+    return total, rows
+
+
+def search(model, term, page=1, per_page=RESULTS_PER_PAGE):
+    """Ranked, case-insensitive search on name, city and genres returning one
+    page of results.
+
+    Args:
+        model: Venue or Artist
+        term (str): the search term
+        page (int, optional): 1-based page number. Defaults to 1.
+        per_page (int, optional): page size. Defaults to RESULTS_PER_PAGE.
+
+    Returns:
+        dict: {"count", "data", "page", "pages"} where count is the total
+        number of matches and data only holds the requested page
+    """
+    page = max(page, 1)
+    total, rows = ranked_matches(model, term.strip(), per_page, (page - 1) * per_page)
+    data = [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.upcoming_shows_count
+    } for row in rows]
+    return {
+        "count": total,
+        "data": data,
+        "page": page,
+        "pages": (total + per_page - 1) // per_page
+    }
+
+
+def find_venues(term, page=1):
+    return search(Venue, term, page)
+
+
+def find_artists(term, page=1):
+    return search(Artist, term, page)
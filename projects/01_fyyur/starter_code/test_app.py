@@ -0,0 +1,250 @@
+import os
+import time
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from app import app, db
+from models import Venue, Artist, Show
+from counters import roll_over_shows, rebuild_counters
+from cache import page_cache, PageCache, FileSystemBackend
+from search import search, find_venues
+
+TEST_DATABASE_URI = os.environ.get(
+    'FYYUR_TEST_DATABASE_URI', 'postgres://localhost:5432/fyyur_test')
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URI
+        self.client = app.test_client
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+        page_cache.clear()
+
+        now = datetime.now()
+        self.venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz'])
+        self.artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll'])
+        db.session.add_all([self.venue, self.artist])
+        db.session.flush()
+        db.session.add_all([
+            Show(venue_id=self.venue.id, artist_id=self.artist.id, start_time=now - timedelta(days=30)),
+            Show(venue_id=self.venue.id, artist_id=self.artist.id, start_time=now + timedelta(days=30)),
+            Show(venue_id=self.venue.id, artist_id=self.artist.id, start_time=now + timedelta(days=60)),
+        ])
+        db.session.commit()
+        self.venue_id, self.artist_id = self.venue.id, self.artist.id
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """Fails the test if the block sends more than limit statements.
+
+        Yields the list of (statement, parameters) sent inside the block.
+        """
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertLessEqual(len(statements), limit,
+                             '\n\n'.join(statement for statement, _ in statements))
+
+    def assertUsesIndex(self, statement, parameters, index):
+        """EXPLAINs a captured statement and fails if the plan skips index.
+
+        Sequential scans are switched off for the check: the test tables are
+        tiny, so the planner would otherwise always prefer them.
+        """
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
+        self.assertIn(index, plan)
+
+    def test_show_venue_queries(self):
+        with self.assertMaxQueries(2):
+            res = self.client().get('/venues/{}'.format(self.venue_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'1 Past Show', res.data)
+
+    def test_show_artist_queries(self):
+        with self.assertMaxQueries(2):
+            res = self.client().get('/artists/{}'.format(self.artist_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'1 Past Show', res.data)
+
+    @unittest.skipUnless(TEST_DATABASE_URI.startswith('postgres'), 'needs EXPLAIN from PostgreSQL')
+    def test_show_venue_uses_index(self):
+        with self.assertMaxQueries(2) as statements:
+            self.client().get('/venues/{}'.format(self.venue_id))
+        shows_statement = [s for s in statements if 'FROM shows' in s[0]][0]
+        self.assertUsesIndex(*shows_statement, index='ix_shows_venue_id_start_time')
+
+    @unittest.skipUnless(TEST_DATABASE_URI.startswith('postgres'), 'needs EXPLAIN from PostgreSQL')
+    def test_show_artist_uses_index(self):
+        with self.assertMaxQueries(2) as statements:
+            self.client().get('/artists/{}'.format(self.artist_id))
+        shows_statement = [s for s in statements if 'FROM shows' in s[0]][0]
+        self.assertUsesIndex(*shows_statement, index='ix_shows_artist_id_start_time')
+
+    def test_shows_keyset_pages(self):
+        with self.assertMaxQueries(1):
+            res = self.client().get('/shows?limit=2')
+            body = res.get_data(as_text=True)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(body.count('tile-show'), 2)
+        self.assertIn('after=', body)
+        next_url = body.split('href="/shows?', 1)[1].split('"', 1)[0].replace('&amp;', '&')
+        res = self.client().get('/shows?' + next_url)
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 1)
+
+    def test_shows_filters(self):
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        res = self.client().get('/shows?artist_id={}&from={}'.format(self.artist_id, tomorrow))
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 2)
+        res = self.client().get('/shows?venue_id={}'.format(self.venue_id + 1000))
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 0)
+
+    def test_shows_until_includes_end_date(self):
+        # the second show of setUp starts during the day 30 days from now
+        end_date = datetime.now() + timedelta(days=30)
+        until = end_date.strftime('%Y-%m-%d')
+        res = self.client().get('/shows?artist_id={}&until={}'.format(self.artist_id, until))
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 2)
+        before = (end_date - timedelta(days=1)).strftime('%Y-%m-%d')
+        res = self.client().get('/shows?artist_id={}&until={}'.format(self.artist_id, before))
+        self.assertEqual(res.get_data(as_text=True).count('tile-show'), 1)
+
+    def upcoming_counts(self):
+        db.session.expire_all()
+        return (Venue.query.get(self.venue_id).upcoming_shows_count,
+                Artist.query.get(self.artist_id).upcoming_shows_count)
+
+    def test_counters_follow_show_writes(self):
+        self.assertEqual(self.upcoming_counts(), (2, 2))
+        show = Show.query.filter(Show.start_time > datetime.now()).first()
+        db.session.delete(show)
+        db.session.commit()
+        self.assertEqual(self.upcoming_counts(), (1, 1))
+
+    def test_counters_follow_venue_delete(self):
+        db.session.delete(Venue.query.get(self.venue_id))
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(Artist.query.get(self.artist_id).upcoming_shows_count, 0)
+
+    def test_roll_over_shows(self):
+        self.assertEqual(roll_over_shows(datetime.now() + timedelta(days=45)), 1)
+        self.assertEqual(self.upcoming_counts(), (1, 1))
+        self.assertEqual(roll_over_shows(datetime.now() + timedelta(days=45)), 0)
+        rebuild_counters()
+        self.assertEqual(self.upcoming_counts(), (2, 2))
+
+    def test_delete_show_rolled_over_after_loading(self):
+        show = Show.query.filter(Show.start_time > datetime.now()).order_by(Show.start_time).first()
+        self.assertTrue(show.counted_upcoming)
+        self.assertEqual(roll_over_shows(datetime.now() + timedelta(days=45)), 1)
+        db.session.delete(show)
+        db.session.commit()
+        self.assertEqual(self.upcoming_counts(), (1, 1))
+
+    def test_cached_page_etag(self):
+        res = self.client().get('/venues')
+        etag = res.headers['ETag']
+        with self.assertMaxQueries(0):
+            res = self.client().get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertIn('fyyur_cache_hits_total{namespace="venues"}',
+                      self.client().get('/metrics/cache').get_data(as_text=True))
+
+    def test_streamed_page_not_cached(self):
+        self.client().get('/shows')
+        with self.assertMaxQueries(1):
+            res = self.client().get('/shows')
+        self.assertTrue(res.is_streamed)
+        self.assertNotIn('ETag', res.headers)
+
+    def test_filesystem_cache_removes_stale_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PageCache(FileSystemBackend(directory), timeout=300)
+            cache.get_or_set('venues', '/venues', lambda: b'page')
+            cache.get_or_set('artists', '/artists', lambda: b'page')
+            self.assertEqual(len(os.listdir(directory)), 2)
+            cache.invalidate('venues')
+            # the artists page and the venues version are left
+            self.assertEqual(len(os.listdir(directory)), 2)
+            cache.timeout = 0.01
+            cache.get_or_set('venues', '/venues', lambda: b'page')
+            time.sleep(0.02)
+            cache.backend.sweep()
+            self.assertEqual(len(os.listdir(directory)), 2)
+            self.assertEqual(cache.get_or_set('artists', '/artists', lambda: b'new'), b'page')
+
+    def test_write_invalidates_cache(self):
+        self.client().get('/venues/{}'.format(self.venue_id))
+        self.client().post('/shows/create', data={
+            'artist_id': self.artist_id,
+            'venue_id': self.venue_id,
+            'start_time': (datetime.now() + timedelta(days=90)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+        res = self.client().get('/venues/{}'.format(self.venue_id))
+        self.assertIn(b'3 Upcoming Shows', res.data)
+
+    def test_search_venues_by_genre(self):
+        res = self.client().post('/venues/search', data={'search_term': 'jazz'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_search_artists(self):
+        res = self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_search_ranks_and_pages(self):
+        db.session.add_all([
+            Venue(name='Hop Street', city='Austin', state='TX', genres=['Folk']),
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA', genres=['Folk']),
+        ])
+        db.session.commit()
+        results = find_venues('Hop')
+        self.assertEqual(results['count'], 2)
+        self.assertEqual([venue['name'] for venue in results['data']], ['Hop Street', 'The Musical Hop'])
+        self.assertEqual(results['data'][1]['num_upcoming_shows'], 2)
+        results = search(Venue, 'music', page=2, per_page=1)
+        self.assertEqual((results['count'], results['pages'], len(results['data'])), (2, 2, 1))
+        self.assertEqual(find_venues('no such venue')['count'], 0)
+
+    def test_404_show_venue(self):
+        res = self.client().get('/venues/{}'.format(self.venue_id + 1000))
+        self.assertEqual(res.status_code, 404)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+'''
+Benchmarks for the trivia API on a synthetic question bank.
+
+    python benchmarks.py search --questions 1000000
+        builds the in-process search index (what SQLite gets) from a
+        synthetic corpus and times ranked searches against it
+
+    python benchmarks.py search --questions 1000000 --database-uri postgresql://localhost:5432/trivia_bench
+        loads the corpus into that database (questions are replaced!) and
+        times POST /questions through the app, i.e. the tsvector/GIN search
+
+    python benchmarks.py writes --questions 100000 --database-uri postgresql://localhost:5432/trivia_bench
+        compares create/delete throughput with the minimal write responses
+        and with ?response=full
+
+    python benchmarks.py serialize --rows 10000
+        time spent turning 10k questions into the JSON of the list and
+        export endpoints, ORM objects + jsonify against row tuples + the
+        serializers (with orjson if it is installed, then the json module)
+'''
+import time
+import random
+import itertools
+import argparse
+import statistics
+
+WORDS_IN_VOCABULARY = 20000
+WORDS_PER_QUESTION = 12
+
+
+def vocabulary(seed=0):
+  rng = random.Random(seed)
+  letters = 'abcdefghijklmnopqrstuvwxyz'
+  words = set()
+  while len(words) < WORDS_IN_VOCABULARY:
+    words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+  words = sorted(words)
+  # Zipf like frequencies: a few very common words and a long tail
+  cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(words) + 1)))
+  return words, cum_weights
+
+'''
+synthetic_questions(count)
+    yields (id, question, answer, category, difficulty) rows
+'''
+def synthetic_questions(count, seed=0):
+  rng = random.Random(seed)
+  words, cum_weights = vocabulary(seed)
+  for question_id in range(1, count + 1):
+    text = rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_QUESTION)
+    yield (question_id, ' '.join(text[:-2]) + '?', ' '.join(text[-2:]),
+           rng.randint(1, 6), rng.randint(1, 5))
+
+
+def sample_terms(count, seed=1):
+  rng = random.Random(seed)
+  words, cum_weights = vocabulary()
+  # one common word, one rare word, and two word searches
+  return [rng.choice([
+    ' '.join(rng.choices(words[:50], k=1)),
+    ' '.join(rng.choices(words, k=1)),
+    ' '.join(rng.choices(words, cum_weights=cum_weights, k=2)),
+  ]) for _ in range(count)]
+
+
+def report(name, timings):
+  timings = sorted(timings)
+  print('%-28s n=%-5d p50=%8.2fms p95=%8.2fms max=%8.2fms' % (
+    name, len(timings), statistics.median(timings) * 1000,
+    timings[int(len(timings) * 0.95) - 1] * 1000, timings[-1] * 1000))
+
+
+def bench_index(args):
+  from flaskr.search import InvertedIndex
+  index = InvertedIndex()
+  start = time.perf_counter()
+  for question_id, question, answer, category, difficulty in synthetic_questions(args.questions):
+    index.add(question_id, '%s %s' % (question, answer), category, difficulty)
+  print('indexed %d questions in %.1fs' % (args.questions, time.perf_counter() - start))
+
+  for name, filters in (('search', {}), ('search category+difficulty', {'category': 3, 'difficulty': 2})):
+    timings = []
+    for term in sample_terms(args.queries):
+      start = time.perf_counter()
+      index.search(term, **filters)
+      timings.append(time.perf_counter() - start)
+    report(name, timings)
+
+
+def seed_database(app, count, batch_size=10000):
+  from models import db, Question, Category
+  with app.app_context():
+    db.session.query(Question).delete()
+    if not Category.query.count():
+      db.session.add_all([Category(type) for type in
+                          ('Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports')])
+    db.session.commit()
+    batch = []
+    for question_id, question, answer, category, difficulty in synthetic_questions(count):
+      batch.append({'id': question_id, 'question': question, 'answer': answer,
+                    'category': category, 'difficulty': difficulty})
+      if len(batch) == batch_size:
+        db.session.execute(Question.__table__.insert(), batch)
+        batch = []
+    if batch:
+      db.session.execute(Question.__table__.insert(), batch)
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute("SELECT setval('questions_id_seq', :count)", {'count': count})
+      db.session.execute('ANALYZE questions')
+      db.session.commit()
+
+
+def create_bench_app(database_uri):
+  from flaskr import create_app
+  from models import setup_db
+  # one process, so the in-memory caches are safe to turn on
+  app = create_app({'CACHE_QUESTION_COUNTS': True, 'CACHE_CATEGORIES': True, 'CACHE_QUIZ_IDS': True})
+  setup_db(app, database_uri)
+  return app
+
+
+def bench_database(args):
+  app = create_bench_app(args.database_uri)
+  if not args.skip_seed:
+    start = time.perf_counter()
+    seed_database(app, args.questions)
+    print('loaded %d questions in %.1fs' % (args.questions, time.perf_counter() - start))
+  client = app.test_client()
+  for name, filters in (('POST /questions', {}), ('POST /questions filtered', {'category': 3, 'difficulty': 2})):
+    timings = []
+    for term in sample_terms(args.queries):
+      start = time.perf_counter()
+      res = client.post('/questions', json=dict(filters, searchTerm=term))
+      timings.append(time.perf_counter() - start)
+      assert res.status_code == 200, res.data
+    report(name, timings)
+
+
+def bench_search(args):
+  if args.database_uri:
+    bench_database(args)
+  else:
+    bench_index(args)
+
+
+def bench_writes(args):
+  app = create_bench_app(args.database_uri)
+  if not args.skip_seed:
+    seed_database(app, args.questions)
+  client = app.test_client()
+  for mode in ('minimal', 'full'):
+    start = time.perf_counter()
+    for n in range(args.writes):
+      res = client.post('/questions/add?response=' + mode, json={
+        'question': 'Load test question %d?' % n, 'answer': 'Yes', 'category': 1 + n % 6, 'difficulty': 1 + n % 5})
+      assert res.status_code == 200, res.data
+      res = client.delete('/questions/%d?response=%s' % (res.get_json()['created'], mode))
+      assert res.status_code == 200, res.data
+    elapsed = time.perf_counter() - start
+    print('%-8s %d writes in %.1fs, %.0f writes/s' % (mode, args.writes * 2, elapsed, args.writes * 2 / elapsed))
+
+
+def bench_serialize(args):
+  import json
+  from flask import jsonify
+  from models import db, Question
+  from flaskr import serializers
+  from flaskr.serializers import question_rows, question_dict, json_response, ndjson_lines
+
+  app = create_bench_app(args.database_uri)
+  if not args.skip_seed:
+    seed_database(app, args.rows)
+
+  def page_query():
+    return Question.query.order_by(Question.id).limit(args.rows)
+
+  paths = {
+    '/questions  orm+jsonify': lambda: jsonify({
+      'success': True, 'questions': [question.format() for question in page_query()]}).get_data(),
+    '/questions  rows+serializers': lambda: json_response({
+      'success': True, 'questions': [question_dict(row) for row in question_rows(page_query())]}).get_data(),
+    '/questions/export  orm+json': lambda: ''.join(
+      json.dumps(question.format()) + '\n' for question in page_query()),
+    '/questions/export  rows+serializers': lambda: b''.join(
+      ndjson_lines(question_rows(page_query()).yield_per(1000))),
+  }
+  encoders = [('orjson', serializers.orjson)] if serializers.orjson is not None else []
+  encoders.append(('json', None))
+  with app.test_request_context():
+    for encoder, module in encoders:
+      serializers.orjson = module
+      for name, run in paths.items():
+        if encoder != encoders[0][0] and 'serializers' not in name:
+          continue
+        timings = []
+        for _ in range(args.repeat):
+          start = time.perf_counter()
+          run()
+          timings.append(time.perf_counter() - start)
+          db.session.remove()
+        print('%-38s %-7s %8.1fms per 10k rows' % (
+          name, encoder if 'serializers' in name else '', min(timings) * 1000 * 10000 / args.rows))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  commands = parser.add_subparsers(dest='command')
+  commands.required = True
+
+  search = commands.add_parser('search', help='ranked full-text search')
+  search.add_argument('--questions', type=int, default=1000000)
+  search.add_argument('--queries', type=int, default=200)
+  search.add_argument('--database-uri', help='benchmark the search endpoint against this database')
+  search.add_argument('--skip-seed', action='store_true', help='reuse the questions already loaded')
+  search.set_defaults(run=bench_search)
+
+  writes = commands.add_parser('writes', help='create/delete throughput per response mode')
+  writes.add_argument('--database-uri', required=True, help='database to write to (questions are replaced!)')
+  writes.add_argument('--questions', type=int, default=100000)
+  writes.add_argument('--writes', type=int, default=1000, help='questions created, then deleted, per mode')
+  writes.add_argument('--skip-seed', action='store_true', help='reuse the questions already loaded')
+  writes.set_defaults(run=bench_writes)
+
+  serialize = commands.add_parser('serialize', help='JSON serialization cost of the list endpoints')
+  serialize.add_argument('--database-uri', default='sqlite://', help='in-memory SQLite by default')
+  serialize.add_argument('--rows', type=int, default=10000)
+  serialize.add_argument('--repeat', type=int, default=5)
+  serialize.add_argument('--skip-seed', action='store_true', help='reuse the questions already loaded')
+  serialize.set_defaults(run=bench_serialize)
+
+  args = parser.parse_args()
+  args.run(args)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,24 +1,41 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+import time
 import random
+import click
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, QuizStat, PlayerScore
+from .pagination import paginate, CountCache
+from .quiz import QuizPicker
+from .sessions import make_store, new_session_id
+from .search import QuestionSearch
+from .catalog import CategoryCatalog
+from .bulk import read_rows, import_questions, export_questions, ImportFailed
+from .serializers import json_response
+from .analytics import QuizEvents, rebuild_quiz_stats
 
 QUESTIONS_PER_PAGE = 10
-
-def paginate_items(request, items):
-  page = request.args.get('page', 1 , type = int)
-  start = (page-1)* QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-  questions = [question.format() for question in items]
-  return questions[start:end]
+QUESTIONS_PER_QUIZ = 5
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  if test_config:
+    app.config.update(test_config)
   setup_db(app)
+  # total question counts, per category, reused until the next write;
+  # process-local, so off unless the app runs in a single process
+  question_counts = CountCache(app.config.get('CACHE_QUESTION_COUNTS', False))
+  # the question ids quizzes draw from, process-local as well
+  quiz_picker = QuizPicker(enabled=app.config.get('CACHE_QUIZ_IDS', False))
+  quiz_sessions = make_store(app.config)
+  question_search = QuestionSearch()
+  # process-local like question_counts, off unless a single process
+  categories = CategoryCatalog(app.config.get('CACHE_CATEGORIES', False))
+  quiz_events = QuizEvents(app.config.get('QUIZ_EVENTS_FLUSH_SIZE', 100),
+                           app.config.get('QUIZ_EVENTS_FLUSH_INTERVAL', 5.0))
 
   
   '''
@@ -43,15 +60,7 @@ def create_app(test_config=None):
   @app.route('/categories', methods = ['GET'])
   def retrive_categories():
     try:
-      categories = Category.query.order_by(Category.id).all()
-      results = {}
-      for category in categories:
-        results[category.id] = category.type
-      result = {
-        'success': True,
-        'categories': results
-      }
-      return jsonify(result)
+      return app.response_class(categories.payload(), mimetype='application/json')
     except:
       abort(404)
 
@@ -70,10 +79,8 @@ def create_app(test_config=None):
   '''
   @app.route('/questions', methods = ['GET'])
   def retrieve_questions():
-    questions = Question.query.order_by(Question.id).all()
-    current_questions = paginate_items(request, questions)
-    categories = Category.query.order_by(Category.id).all()
-    categories_list = [category.type for category in categories]
+    current_questions = paginate(request, Question.query, QUESTIONS_PER_PAGE)
+    categories_list = categories.types()
 
     if len(current_questions) == 0:
       abort(404)
@@ -81,11 +88,11 @@ def create_app(test_config=None):
     result = {
       'success': True,
       'questions': current_questions,
-      'total_questions':len(questions),
+      'total_questions': question_counts.get(None, Question.query),
       'categories': categories_list,
       'current_category': None
     }
-    return jsonify(result)
+    return json_response(result)
 
   '''
   @TODO: 
@@ -94,6 +101,13 @@ def create_app(test_config=None):
   TEST: When you click the trash icon next to a question, the question will be removed.
   This removal will persist in the database and when you refresh the page. 
   '''
+  def full_write_response():
+    # writes answer with the affected id and the new total, the current
+    # page of questions is only sent back with ?response=full (or when
+    # WRITE_RESPONSE is 'full')
+    mode = request.args.get('response', app.config.get('WRITE_RESPONSE', 'minimal'))
+    return mode == 'full'
+
   @app.route('/questions/<int:question_id>', methods = ['DELETE'])
   def delete_question(question_id):
     question = Question.query.filter(Question.id == question_id).one_or_none()
@@ -101,15 +115,19 @@ def create_app(test_config=None):
       abort(404)
     else:
       try:
+        category = question.category
         question.delete()
-        questions = Question.query.order_by(Question.id).all()
-        current_questions = paginate_items(request, questions)
+        question_counts.adjust(None, -1)
+        question_counts.adjust(category, -1)
+        quiz_picker.invalidate()
+        question_search.remove(question_id)
         result = {
           'success':True,
           'deleted': question_id,
-          'questions':current_questions,
-          'total_questions': len(questions),
+          'total_questions': question_counts.get(None, Question.query),
         }
+        if full_write_response():
+          result['questions'] = paginate(request, Question.query, QUESTIONS_PER_PAGE)
         return jsonify(result)
       except:
         abort(404)
@@ -135,21 +153,100 @@ def create_app(test_config=None):
       try:
         question = Question(question=question_text, answer=answer, category=category, difficulty=difficulty)
         question.insert()
-        questions = Question.query.order_by(Question.id).all()
-        current_questions = paginate_items(request, questions)
-        categories = Category.query.order_by(Category.id).all()
-        categories_list = [category.type for category in categories]
-        return jsonify({
+        question_counts.adjust(None, 1)
+        question_counts.adjust(question.category, 1)
+        quiz_picker.invalidate()
+        question_search.add(question)
+        result = {
           'success': True,
           'created': question.id,
-          'questions': current_questions,
-          'total_questions': len(questions),
-          'categories': categories_list,
-          'current_category': None
-          })
+          'total_questions': question_counts.get(None, Question.query),
+        }
+        if full_write_response():
+          result['questions'] = paginate(request, Question.query, QUESTIONS_PER_PAGE)
+          result['categories'] = categories.types()
+          result['current_category'] = None
+        return jsonify(result)
       except:
         abort(422)
 
+  '''
+  Bulk import and export of questions, for moving whole question banks.
+  Uploads are NDJSON (one question object per line) or CSV with a header
+  line, as a multipart "file" or as the request body.
+  '''
+  def import_format(filename, content_type):
+    format = request.args.get('format', None)
+    if format is None:
+      is_csv = (filename or '').lower().endswith('.csv') or 'csv' in (content_type or '')
+      format = 'csv' if is_csv else 'ndjson'
+    if format not in ('csv', 'ndjson'):
+      abort(400)
+    return format
+
+  def run_import(stream, format):
+    try:
+      imported, errors = import_questions(read_rows(stream, format), categories.ids())
+    finally:
+      question_counts.invalidate()
+      quiz_picker.invalidate()
+      question_search.invalidate()
+    return imported, errors
+
+  @app.route('/questions/import', methods=['POST'])
+  def bulk_import_questions():
+    upload = request.files.get('file', None)
+    if upload is not None:
+      stream, format = upload.stream, import_format(upload.filename, upload.content_type)
+    else:
+      stream, format = request.stream, import_format(None, request.content_type)
+    try:
+      imported, errors = run_import(stream, format)
+    except ImportFailed as failure:
+      # nothing was imported, say where the input went wrong
+      return jsonify({
+        'success': False,
+        'error': 422,
+        'message': 'Unprocessabe',
+        'imported': 0,
+        'line': failure.line,
+        'reason': failure.message
+      }), 422
+    except:
+      abort(422)
+    return jsonify({
+      'success': True,
+      'imported': imported,
+      'errors': errors
+    })
+
+  @app.route('/questions/export', methods=['GET'])
+  def bulk_export_questions():
+    return Response(stream_with_context(export_questions()), mimetype='application/x-ndjson')
+
+  @app.cli.command('import-questions')
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--format', type=click.Choice(['ndjson', 'csv']), default=None,
+                help='file format, guessed from the extension by default')
+  def import_questions_command(path, format):
+    """Import the questions of an NDJSON or CSV file."""
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, 'rb') as f:
+      try:
+        imported, errors = run_import(f, format)
+      except ImportFailed as failure:
+        raise click.ClickException('%s, nothing was imported' % failure)
+    for error in errors:
+      click.echo('line %(line)d: %(error)s' % error, err=True)
+    click.echo('%d questions imported' % imported)
+
+  @app.cli.command('export-questions')
+  @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+  def export_questions_command(path):
+    """Export every question to an NDJSON file."""
+    with open(path, 'wb') as f:
+      f.writelines(export_questions())
+
   '''
   @TODO: 
   Create a POST endpoint to get questions based on a search term. 
@@ -166,12 +263,16 @@ def create_app(test_config=None):
     search = body.get('searchTerm', None)
     if search != None:
       try:
-        questions = Question.query.filter(Question.question.ilike('%{}%'.format(search))).all()
-        questions_list = [question.format() for question in questions]
-        return jsonify({
+        questions_list, total = question_search.search(
+          search,
+          category=body.get('category', None),
+          difficulty=body.get('difficulty', None),
+          page=int(body.get('page', request.args.get('page', 1, type=int))),
+          per_page=QUESTIONS_PER_PAGE)
+        return json_response({
           'success': True,
           'questions': questions_list,
-          'total_questions': len(questions_list),
+          'total_questions': total,
           'current_category': None
         })
       except:
@@ -191,16 +292,14 @@ def create_app(test_config=None):
   @app.route('/categories/<int:category_id>/questions')
   def retrieve_questions_by_category(category_id):
     try:
-      categories = Category.query.all()
-      category_ids = [category.id for category in categories]
-      if category_id not in category_ids:
+      if category_id not in categories:
         abort(404)
-      questions_in_category = Question.query.filter(Question.category == str(category_id)).all()
-      current_questions = paginate_items(request, questions_in_category)
-      return jsonify({
+      questions_in_category = Question.query.filter(Question.category == category_id)
+      current_questions = paginate(request, questions_in_category, QUESTIONS_PER_PAGE)
+      return json_response({
         'success':True,
         'questions': current_questions,
-        'total_questions': len(questions_in_category),
+        'total_questions': question_counts.get(category_id, questions_in_category),
         'current_category':category_id
         })
     except:
@@ -225,23 +324,26 @@ def create_app(test_config=None):
       previous_questions = body.get("previous_questions", [])
       quiz_category = body.get("quiz_category", None)
       try:
-        category_id = int(quiz_category["id"]) + 1
-        if quiz_category:
-            if quiz_category["id"] == 0:
-                quiz = Question.query.all()
-            else:
-                quiz = Question.query.filter_by(category=category_id).all()
-        if not quiz:
+        # id 0 stands for all the categories
+        category_id = int(quiz_category["id"]) or None
+        if not quiz_picker.ids(category_id):
             return abort(422)
-        selected = []
-        for question in quiz:
-            if question.id not in previous_questions:
-                selected.append(question.format())
-        if len(selected) != 0:
-            result = random.choice(selected)
+        skipped = list(previous_questions)
+        question = None
+        while question is None:
+            question_id = quiz_picker.pick(category_id, skipped)
+            if question_id is None:
+                break
+            question = Question.query.get(question_id)
+            if question is None:
+                # deleted by another worker since the ids were cached
+                quiz_picker.invalidate()
+                skipped.append(question_id)
+        if question is not None:
+            quiz_events.record('served', question, player=body.get('player', None))
             return jsonify({
               'success': True,
-              "question": result
+              "question": question.format()
             })
         else:
             return jsonify({"question": False})
@@ -249,6 +351,141 @@ def create_app(test_config=None):
         abort(422)
 
 
+  '''
+  Quiz sessions: the server keeps the questions drawn for a quiz, so each
+  round is a constant size request instead of the growing
+  previous_questions list of /quizzes.
+  '''
+  @app.route("/quizzes/sessions", methods=["POST"])
+  def start_quiz():
+    body = request.get_json() or {}
+    quiz_category = body.get("quiz_category", None)
+    try:
+      # id 0 stands for all the categories
+      category_id = int(quiz_category["id"]) or None
+      total = int(body.get("questions", QUESTIONS_PER_QUIZ))
+    except:
+      abort(400)
+    ids = quiz_picker.ids(category_id)
+    if not ids or total < 1:
+      abort(422)
+    # never more rounds than there are questions to draw from
+    total = min(total, len(ids))
+    session_id = new_session_id()
+    quiz_sessions.set(session_id, {
+      'questions': random.sample(ids, total),
+      'cursor': 0,
+      'answered': True,
+      'score': 0,
+      'player': body.get('player', None),
+      'served_at': None
+    })
+    return jsonify({
+      'success': True,
+      'session_id': session_id,
+      'total_questions': total
+    })
+
+  def get_quiz(session_id):
+    state = quiz_sessions.get(session_id)
+    if state is None:
+      abort(404)
+    return state
+
+  @app.route("/quizzes/sessions/<session_id>/next", methods=["POST"])
+  def next_quiz_question(session_id):
+    state = get_quiz(session_id)
+    question = None
+    while question is None and state['cursor'] < len(state['questions']):
+      # questions deleted since the quiz started are skipped
+      question = Question.query.get(state['questions'][state['cursor']])
+      state['cursor'] += 1
+    state['answered'] = question is None
+    state['served_at'] = time.time()
+    quiz_sessions.set(session_id, state)
+    if question is None:
+      return jsonify({'success': True, 'question': False})
+    quiz_events.record('served', question, player=state['player'])
+    question = question.format()
+    del question['answer']
+    return jsonify({
+      'success': True,
+      'question': question,
+      'round': state['cursor']
+    })
+
+  @app.route("/quizzes/sessions/<session_id>/answer", methods=["POST"])
+  def answer_quiz_question(session_id):
+    state = get_quiz(session_id)
+    answer = (request.get_json() or {}).get('answer', None)
+    if not isinstance(answer, str):
+      abort(400)
+    if state['answered']:
+      abort(422)
+    question = Question.query.get(state['questions'][state['cursor'] - 1])
+    if question is None:
+      abort(422)
+    correct = answer.strip().lower() == question.answer.strip().lower()
+    state['score'] += int(correct)
+    state['answered'] = True
+    quiz_sessions.set(session_id, state)
+    quiz_events.record('answered', question, player=state['player'], correct=correct,
+                       seconds=time.time() - state['served_at'])
+    return jsonify({
+      'success': True,
+      'correct': correct,
+      'answer': question.answer,
+      'score': state['score']
+    })
+
+  @app.route("/quizzes/sessions/<session_id>", methods=["DELETE"])
+  def finish_quiz(session_id):
+    state = get_quiz(session_id)
+    quiz_sessions.delete(session_id)
+    return jsonify({
+      'success': True,
+      'score': state['score'],
+      'total_questions': state['cursor']
+    })
+
+  '''
+  Quiz statistics, read from the counters rolled up by QuizEvents.
+  Events still waiting in this process' buffer are flushed first.
+  '''
+  @app.route("/quizzes/stats", methods=["GET"])
+  def quiz_stats():
+    quiz_events.flush()
+    query = QuizStat.query.order_by(QuizStat.category, QuizStat.difficulty)
+    category = request.args.get('category', None, type=int)
+    if category is not None:
+      query = query.filter(QuizStat.category == category)
+    difficulty = request.args.get('difficulty', None, type=int)
+    if difficulty is not None:
+      query = query.filter(QuizStat.difficulty == difficulty)
+    return jsonify({
+      'success': True,
+      'stats': [stat.format() for stat in query]
+    })
+
+  @app.route("/quizzes/leaderboard", methods=["GET"])
+  def quiz_leaderboard():
+    quiz_events.flush()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    players = PlayerScore.query.order_by(PlayerScore.correct.desc(), PlayerScore.answered, PlayerScore.player) \
+      .limit(limit).all()
+    return jsonify({
+      'success': True,
+      'leaderboard': [player.format() for player in players]
+    })
+
+  @app.cli.command('rebuild-quiz-stats')
+  def rebuild_quiz_stats_command():
+    """Recompute the quiz statistics from the event log."""
+    quiz_events.flush()
+    rebuild_quiz_stats()
+    click.echo('quiz statistics rebuilt')
+
+
   '''
   @TODO: 
   Create error handlers for all expected errors 
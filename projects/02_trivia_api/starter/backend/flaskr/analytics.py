@@ -0,0 +1,182 @@
+import time
+import atexit
+import logging
+import threading
+import weakref
+from datetime import datetime
+from sqlalchemy import func, case, select, text
+
+from models import db, QuizEvent, QuizStat, PlayerScore
+
+events_table = QuizEvent.__table__
+stats_table = QuizStat.__table__
+leaderboard_table = PlayerScore.__table__
+
+logger = logging.getLogger(__name__)
+
+'''
+add_deltas(connection, table, keys, deltas)
+    adds deltas ({key values: {column: delta}}) to the counters of table,
+    inserting the rows that don't exist yet. It is a single INSERT ... ON
+    CONFLICT DO UPDATE (PostgreSQL, SQLite 3.24+), so two workers creating
+    the same row at once both end up counted.
+'''
+def add_deltas(connection, table, keys, deltas):
+  if not deltas:
+    return
+  columns = sorted({name for values in deltas.values() for name in values})
+  names = list(keys) + columns
+  statement = text(
+    'INSERT INTO {table} ({names}) VALUES ({values}) '
+    'ON CONFLICT ({keys}) DO UPDATE SET {updates}'.format(
+      table=table.name,
+      names=', '.join(names),
+      values=', '.join(':' + name for name in names),
+      keys=', '.join(keys),
+      updates=', '.join('{0} = {1}.{0} + excluded.{0}'.format(name, table.name) for name in columns)))
+  rows = []
+  for key, values in deltas.items():
+    row = dict(zip(keys, key))
+    row.update({name: values.get(name, 0) for name in columns})
+    rows.append(row)
+  connection.execute(statement, rows)
+
+
+'''
+QuizEvents
+    buffers quiz events in memory and writes them in batches: each flush
+    appends the events to quiz_events and, in the same transaction, adds
+    them to the quiz_stats and quiz_leaderboard counters, so the stats
+    endpoints only ever read the small summary tables.
+    A flush happens once flush_size events are waiting or the oldest has
+    waited flush_interval seconds. A failed flush keeps the events for the
+    next one and doesn't fail the request that recorded them; past
+    max_buffered waiting events the oldest are dropped.
+'''
+class QuizEvents:
+
+  def __init__(self, flush_size=100, flush_interval=5.0, max_buffered=None):
+    self.flush_size = flush_size
+    self.flush_interval = flush_interval
+    self.max_buffered = max_buffered or flush_size * 100
+    self.buffer = []
+    self.oldest = None
+    self.lock = threading.Lock()
+    self.flush_lock = threading.Lock()
+    instances.add(self)
+
+  def record(self, kind, question, player=None, correct=None, seconds=None):
+    with self.lock:
+      if not self.buffer:
+        self.oldest = time.time()
+      self.buffer.append({
+        'kind': kind,
+        'question_id': question.id,
+        'category': question.category,
+        'difficulty': question.difficulty,
+        'player': player,
+        'correct': correct,
+        'seconds': seconds,
+        'created_at': datetime.utcnow()
+      })
+      due = len(self.buffer) >= self.flush_size or time.time() - self.oldest >= self.flush_interval
+    if due:
+      try:
+        self.flush()
+      except Exception:
+        logger.exception('quiz events flush failed, %d events kept for the next one', len(self.buffer))
+
+  def flush(self):
+    with self.flush_lock:
+      with self.lock:
+        events, self.buffer = self.buffer, []
+      if not events:
+        return 0
+      stats, players = rollup(events)
+      try:
+        with db.engine.begin() as connection:
+          connection.execute(events_table.insert(), events)
+          add_deltas(connection, stats_table, ('category', 'difficulty'), stats)
+          add_deltas(connection, leaderboard_table, ('player',), players)
+      except Exception:
+        # put the events back, they go out with the next flush
+        with self.lock:
+          self.buffer[:0] = events
+          # wait a whole interval before trying the database again
+          self.oldest = time.time()
+          dropped = len(self.buffer) - self.max_buffered
+          if dropped > 0:
+            del self.buffer[:dropped]
+            logger.warning('quiz events buffer full, dropped the %d oldest events', dropped)
+        raise
+      return len(events)
+
+
+# every QuizEvents still alive, flushed once at interpreter exit
+instances = weakref.WeakSet()
+
+@atexit.register
+def flush_all():
+  for quiz_events in list(instances):
+    try:
+      quiz_events.flush()
+    except Exception:
+      logger.exception('quiz events flush at exit failed')
+
+
+'''
+rollup(events)
+    sums up a batch of events into the quiz_stats and quiz_leaderboard
+    deltas taken by add_deltas()
+'''
+def rollup(events):
+  stats = {}
+  players = {}
+  for event in events:
+    key = (event['category'] or 0, event['difficulty'] or 0)
+    deltas = stats.setdefault(key, {'served': 0, 'answered': 0, 'correct': 0, 'seconds': 0.0})
+    if event['kind'] == 'served':
+      deltas['served'] += 1
+      continue
+    deltas['answered'] += 1
+    deltas['correct'] += int(bool(event['correct']))
+    deltas['seconds'] += event['seconds'] or 0.0
+    if event['player']:
+      player = players.setdefault((event['player'],), {'answered': 0, 'correct': 0})
+      player['answered'] += 1
+      player['correct'] += int(bool(event['correct']))
+  return stats, players
+
+
+'''
+rebuild_quiz_stats()
+    recomputes quiz_stats and quiz_leaderboard from the whole event log,
+    e.g. after changing how events are counted
+'''
+def rebuild_quiz_stats():
+  answered = events_table.c.kind == 'answered'
+  correct = answered & events_table.c.correct
+  with db.engine.begin() as connection:
+    connection.execute(stats_table.delete())
+    connection.execute(leaderboard_table.delete())
+    category = func.coalesce(events_table.c.category, 0)
+    difficulty = func.coalesce(events_table.c.difficulty, 0)
+    rows = connection.execute(select([
+      category, difficulty,
+      func.sum(case([(events_table.c.kind == 'served', 1)], else_=0)),
+      func.sum(case([(answered, 1)], else_=0)),
+      func.sum(case([(correct, 1)], else_=0)),
+      func.coalesce(func.sum(case([(answered, events_table.c.seconds)], else_=0)), 0),
+    ]).group_by(category, difficulty)).fetchall()
+    if rows:
+      connection.execute(stats_table.insert(), [
+        {'category': row[0], 'difficulty': row[1], 'served': row[2],
+         'answered': row[3], 'correct': row[4], 'seconds': row[5]} for row in rows])
+    rows = connection.execute(select([
+      events_table.c.player,
+      func.count(),
+      func.sum(case([(events_table.c.correct, 1)], else_=0)),
+    ]).where(answered & events_table.c.player.isnot(None)).group_by(events_table.c.player)).fetchall()
+    if rows:
+      connection.execute(leaderboard_table.insert(), [
+        {'player': row[0], 'answered': row[1], 'correct': row[2]} for row in rows])
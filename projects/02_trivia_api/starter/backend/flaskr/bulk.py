@@ -0,0 +1,125 @@
+import csv
+import json
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question
+from .serializers import question_rows, ndjson_lines
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+'''
+read_rows(stream, format)
+    yields (line number, row dict) from a binary stream of NDJSON (one
+    question object per line) or CSV (with a header line)
+'''
+def read_rows(stream, format='ndjson'):
+  text = (line.decode('utf-8') for line in stream)
+  if format == 'csv':
+    reader = csv.DictReader(text)
+    for row in reader:
+      yield reader.line_num, row
+  else:
+    for line_number, line in enumerate(text, 1):
+      if line.strip():
+        try:
+          row = json.loads(line)
+        except ValueError:
+          row = None
+        yield line_number, row
+
+
+'''
+validate(row, categories)
+    returns the insertable values of a question row, or raises ValueError
+    saying what is wrong with it. Ids are left to the database.
+'''
+def validate(row, categories):
+  if not isinstance(row, dict):
+    raise ValueError('not a question object')
+  values = {}
+  for field in ('question', 'answer'):
+    value = row.get(field)
+    if not isinstance(value, str) or not value.strip():
+      raise ValueError('%s is missing' % field)
+    values[field] = value.strip()
+  try:
+    values['category'] = int(row.get('category'))
+    values['difficulty'] = int(row.get('difficulty'))
+  except (TypeError, ValueError):
+    raise ValueError('category and difficulty must be integers')
+  if values['category'] not in categories:
+    raise ValueError('unknown category %d' % values['category'])
+  if not 1 <= values['difficulty'] <= 5:
+    raise ValueError('difficulty must be between 1 and 5')
+  return values
+
+
+'''
+ImportFailed
+    raised by import_questions() when the input can't be read or the
+    database rejects a batch. Nothing was imported; line is the last line
+    read before the failure.
+'''
+class ImportFailed(Exception):
+
+  def __init__(self, line, message):
+    super().__init__('line %d: %s' % (line, message))
+    self.line = line
+    self.message = message
+
+
+'''
+import_questions(rows, categories, batch_size)
+    inserts the valid rows with one executemany INSERT per batch, all in a
+    single transaction, and returns (number of questions imported, errors)
+    where errors lists the first invalid rows as {'line': n, 'error':
+    message}. On ImportFailed the transaction is rolled back, so an import
+    goes in whole or not at all.
+'''
+def import_questions(rows, categories, batch_size=IMPORT_BATCH_SIZE):
+  imported = 0
+  errors = []
+  batch = []
+  line_number = 0
+
+  def flush():
+    db.session.execute(Question.__table__.insert(), batch)
+    del batch[:]
+
+  try:
+    for line_number, row in rows:
+      try:
+        batch.append(validate(row, categories))
+      except ValueError as error:
+        if len(errors) < MAX_REPORTED_ERRORS:
+          errors.append({'line': line_number, 'error': str(error)})
+        continue
+      imported += 1
+      if len(batch) == batch_size:
+        flush()
+    if batch:
+      flush()
+    db.session.commit()
+  except (UnicodeDecodeError, csv.Error) as error:
+    db.session.rollback()
+    raise ImportFailed(line_number, 'unreadable input after this line (%s)' % error)
+  except SQLAlchemyError:
+    db.session.rollback()
+    raise ImportFailed(line_number, 'the database rejected the batch ending at this line')
+  except Exception:
+    db.session.rollback()
+    raise
+  return imported, errors
+
+
+'''
+export_questions()
+    yields every question as one NDJSON line (bytes), reading the table through a
+    server-side cursor so only batch_size rows are in memory at a time
+'''
+def export_questions(batch_size=EXPORT_BATCH_SIZE):
+  rows = question_rows(Question.query).order_by(Question.id).yield_per(batch_size)
+  return ndjson_lines(rows)
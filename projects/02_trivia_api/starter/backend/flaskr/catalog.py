@@ -0,0 +1,66 @@
+import json
+import threading
+from sqlalchemy import event
+
+from models import Category
+
+# bumped by every category write, catalogs loaded before that reload
+version = 0
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def category_changed(mapper, connection, target):
+  global version
+  version += 1
+
+
+'''
+CategoryCatalog
+    the categories, read once and served from memory: the ordered list of
+    types, id -> type lookups and the ready made /categories response body.
+    The version is only bumped by writes made in this process, so unless
+    enabled (single process deployments) every load() reads the table again.
+'''
+class CategoryCatalog:
+
+  def __init__(self, enabled=False):
+    self.enabled = enabled
+    self.lock = threading.Lock()
+    self.loaded = None
+
+  def read(self, loaded_version):
+    categories = [(category.id, category.type)
+                  for category in Category.query.order_by(Category.id).all()]
+    payload = json.dumps({
+      'success': True,
+      'categories': {category_id: type for category_id, type in categories}
+    }).encode('utf-8')
+    return (loaded_version, dict(categories), [type for _, type in categories], payload)
+
+  def load(self):
+    if not self.enabled:
+      return self.read(version)
+    with self.lock:
+      if self.loaded is None or self.loaded[0] != version:
+        self.loaded = self.read(version)
+      return self.loaded
+
+  '''
+  ids()
+      the category ids as a set, for checking many rows against one read
+  '''
+  def ids(self):
+    return frozenset(self.load()[1])
+
+  def types(self):
+    return self.load()[2]
+
+  def get(self, category_id):
+    return self.load()[1].get(category_id)
+
+  def __contains__(self, category_id):
+    return category_id in self.load()[1]
+
+  def payload(self):
+    return self.load()[3]
@@ -0,0 +1,47 @@
+from models import Question
+from .serializers import question_rows, question_dict
+
+'''
+paginate(request, query, per_page)
+    returns one page of formatted questions, fetched with LIMIT/OFFSET
+    (?page=<n>) or, for deep pages, a keyset cursor on the id (?after=<last id seen>)
+    so the database never hands back more than per_page rows
+'''
+def paginate(request, query, per_page):
+  after = request.args.get('after', None, type=int)
+  query = query.order_by(Question.id)
+  if after is not None:
+    query = query.filter(Question.id > after)
+  else:
+    page = max(request.args.get('page', 1, type=int), 1)
+    query = query.offset((page - 1) * per_page)
+  return [question_dict(row) for row in question_rows(query).limit(per_page)]
+
+
+'''
+CountCache
+    remembers COUNT(*) results per key (e.g. None for all questions, or a
+    category id). Single writes adjust() the remembered counts, bulk
+    writes invalidate them. The counts live in this process only, writes
+    made by other worker processes never reach them, so the cache is off
+    unless enabled.
+'''
+class CountCache:
+
+  def __init__(self, enabled=False):
+    self.enabled = enabled
+    self.counts = {}
+
+  def get(self, key, query):
+    if not self.enabled:
+      return query.count()
+    if key not in self.counts:
+      self.counts[key] = query.count()
+    return self.counts[key]
+
+  def adjust(self, key, delta):
+    if key in self.counts:
+      self.counts[key] += delta
+
+  def invalidate(self):
+    self.counts.clear()
@@ -0,0 +1,54 @@
+import random
+from array import array
+
+from models import db, Question
+
+'''
+QuizPicker
+    draws a random question the player hasn't seen yet without loading the
+    questions themselves: the ids of every category are read once into a
+    compact array (None holds all the questions). Only writes made in this
+    process call invalidate(), so unless enabled (single process
+    deployments) the ids are read again on every call.
+'''
+class QuizPicker:
+
+  def __init__(self, max_tries=8, enabled=False):
+    self.max_tries = max_tries
+    self.enabled = enabled
+    self.category_ids = {}
+
+  def read(self, category):
+    query = db.session.query(Question.id).order_by(Question.id)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    return array('l', (row.id for row in query))
+
+  def ids(self, category):
+    if not self.enabled:
+      return self.read(category)
+    if category not in self.category_ids:
+      self.category_ids[category] = self.read(category)
+    return self.category_ids[category]
+
+  def invalidate(self):
+    self.category_ids.clear()
+
+  '''
+  pick(category, previous_questions)
+      returns the id of a random question of category (None for any) that
+      isn't in previous_questions, or None once they have all been asked.
+      Random draws are retried on a collision, only a nearly exhausted
+      category falls back to listing what is left.
+  '''
+  def pick(self, category, previous_questions):
+    ids = self.ids(category)
+    seen = set(previous_questions)
+    for _ in range(self.max_tries):
+      if not ids:
+        return None
+      question_id = random.choice(ids)
+      if question_id not in seen:
+        return question_id
+    remaining = [question_id for question_id in ids if question_id not in seen]
+    return random.choice(remaining) if remaining else None
@@ -0,0 +1,155 @@
+import re
+import math
+import heapq
+import threading
+from array import array
+from collections import Counter
+from sqlalchemy import func, literal_column
+
+from models import db, Question, SEARCH_CONFIG, SEARCH_DOCUMENT
+from .serializers import question_rows, question_dict
+
+WORD = re.compile(r'\w+')
+
+def tokenize(text):
+  return WORD.findall((text or '').lower())
+
+
+'''
+InvertedIndex
+    in-process full-text index over the question and answer text, used when
+    the database has no full-text search of its own (e.g. SQLite).
+    Every word maps to the ids of the questions it appears in (once per
+    occurrence), deleted questions are kept as tombstones until the index
+    is rebuilt.
+'''
+class InvertedIndex:
+
+  def __init__(self):
+    self.postings = {}
+    self.categories = {}
+    self.difficulties = {}
+    self.deleted = set()
+    self.size = 0
+
+  def add(self, question_id, text, category, difficulty):
+    for word in tokenize(text):
+      self.postings.setdefault(word, array('l')).append(question_id)
+    if category is not None:
+      category = int(category)
+    self.categories.setdefault(category, set()).add(question_id)
+    self.difficulties.setdefault(int(difficulty), set()).add(question_id)
+    self.size += 1
+
+  def remove(self, question_id):
+    if question_id not in self.deleted and any(question_id in ids for ids in self.categories.values()):
+      self.deleted.add(question_id)
+      self.size -= 1
+
+  '''
+  search(term, category, difficulty, limit)
+      returns (the ids of the limit most relevant questions containing every
+      word of term, number of such questions). Relevance is tf-idf, ties go
+      to the oldest question.
+  '''
+  def search(self, term, category=None, difficulty=None, limit=10):
+    postings = sorted((self.postings.get(word, ()) for word in set(tokenize(term))), key=len)
+    if not postings or not postings[0]:
+      return [], 0
+    # the rarest word decides which questions can match at all
+    frequencies = Counter(postings[0])
+    matches = set(frequencies) - self.deleted
+    if category is not None:
+      matches &= self.categories.get(int(category), set())
+    if difficulty is not None:
+      matches &= self.difficulties.get(int(difficulty), set())
+    weighted = [(frequencies, math.log((self.size + 1) / len(postings[0])) + 1)]
+    for ids in postings[1:]:
+      frequencies = Counter(filter(matches.__contains__, ids))
+      matches.intersection_update(frequencies)
+      weighted.append((frequencies, math.log((self.size + 1) / len(ids)) + 1))
+
+    # posting lists are in id order, so candidates come oldest first
+    candidates = filter(matches.__contains__, weighted[0][0])
+    if len(weighted) == 1:
+      ranked = heapq.nlargest(limit, candidates, key=weighted[0][0].__getitem__)
+    else:
+      scores = {question_id: sum(frequencies[question_id] * weight for frequencies, weight in weighted)
+                for question_id in candidates}
+      ranked = heapq.nlargest(limit, scores, key=scores.__getitem__)
+    return ranked, len(matches)
+
+
+'''
+QuestionSearch
+    ranked, paginated search over questions, answers included.
+    PostgreSQL matches against the GIN indexed tsvector created by setup_db
+    and ranks with ts_rank, other databases get an InvertedIndex built on
+    the first search and kept in step by add() and remove().
+'''
+class QuestionSearch:
+
+  def __init__(self):
+    self.index = None
+    self.lock = threading.Lock()
+
+  def uses_postgres(self):
+    return db.engine.dialect.name == 'postgresql'
+
+  def get_index(self):
+    with self.lock:
+      if self.index is None:
+        index = InvertedIndex()
+        rows = db.session.query(Question.id, Question.question, Question.answer,
+                                Question.category, Question.difficulty).yield_per(10000)
+        for question_id, question, answer, category, difficulty in rows:
+          index.add(question_id, '%s %s' % (question, answer), category, difficulty)
+        self.index = index
+      return self.index
+
+  def add(self, question):
+    if self.index is not None:
+      self.index.add(question.id, '%s %s' % (question.question, question.answer),
+                     question.category, question.difficulty)
+
+  def remove(self, question_id):
+    if self.index is not None:
+      self.index.remove(question_id)
+
+  def invalidate(self):
+    self.index = None
+
+  def filtered(self, category, difficulty):
+    query = Question.query
+    if category is not None:
+      query = query.filter(Question.category == int(category))
+    if difficulty is not None:
+      query = query.filter(Question.difficulty == int(difficulty))
+    return query
+
+  '''
+  search(term, category=None, difficulty=None, page=1, per_page=10)
+      returns (formatted questions of the page, total number of matches).
+      A term without any word lists every question, by id.
+  '''
+  def search(self, term, category=None, difficulty=None, page=1, per_page=10):
+    offset = (max(page, 1) - 1) * per_page
+    if not tokenize(term):
+      query = self.filtered(category, difficulty)
+      rows = question_rows(query).order_by(Question.id).offset(offset).limit(per_page)
+      return [question_dict(row) for row in rows], query.count()
+
+    if self.uses_postgres():
+      document = literal_column(SEARCH_DOCUMENT)
+      tsquery = func.plainto_tsquery(SEARCH_CONFIG, term)
+      query = self.filtered(category, difficulty).filter(document.op('@@')(tsquery))
+      rows = question_rows(query).order_by(func.ts_rank(document, tsquery).desc(), Question.id) \
+        .offset(offset).limit(per_page)
+      return [question_dict(row) for row in rows], query.count()
+
+    ranked, total = self.get_index().search(term, category, difficulty, offset + per_page)
+    page_ids = ranked[offset:]
+    rows = {}
+    if page_ids:
+      rows = {row[0]: row for row in question_rows(Question.query.filter(Question.id.in_(page_ids)))}
+    return [question_dict(rows[question_id]) for question_id in page_ids if question_id in rows], total
@@ -0,0 +1,52 @@
+import json
+from flask import Response
+
+from models import Question
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+'''
+Serialization of the list endpoints.
+    Questions are selected as plain (id, question, answer, category,
+    difficulty) row tuples instead of ORM objects, turned into dicts once
+    and encoded straight to bytes, with orjson when it is installed and
+    the standard json module otherwise.
+'''
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+
+
+def question_rows(query):
+  return query.with_entities(*QUESTION_COLUMNS)
+
+
+def question_dict(row):
+  return {
+    'id': row[0],
+    'question': row[1],
+    'answer': row[2],
+    'category': row[3],
+    'difficulty': row[4]
+  }
+
+
+def dumps(obj):
+  if orjson is not None:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+  return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+  return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+'''
+ndjson_lines(rows, encode)
+    yields one encoded row per line
+'''
+def ndjson_lines(rows, encode=question_dict):
+  for row in rows:
+    yield dumps(encode(row)) + b'\n'
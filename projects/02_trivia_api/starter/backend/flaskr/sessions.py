@@ -0,0 +1,93 @@
+import json
+import time
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+
+'''
+Quiz session stores
+    keep the state of each quiz being played (the ids drawn for it, a cursor
+    and the score) as a small dict, under a random session id. Sessions
+    untouched for ttl seconds are evicted.
+
+    MemoryStore   in-process, bounded by max_sessions
+    SQLiteStore   one sqlite3 file, shared between workers on the same host
+'''
+def new_session_id():
+  return secrets.token_urlsafe(16)
+
+
+class MemoryStore:
+
+  def __init__(self, ttl=3600, max_sessions=10000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self.sessions = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, session_id):
+    with self.lock:
+      entry = self.sessions.get(session_id)
+      if entry is None or entry[0] < time.time():
+        return None
+      return dict(entry[1])
+
+  def set(self, session_id, state):
+    now = time.time()
+    with self.lock:
+      self.sessions[session_id] = (now + self.ttl, dict(state))
+      self.sessions.move_to_end(session_id)
+      # least recently touched sessions sit at the front
+      while self.sessions:
+        oldest = next(iter(self.sessions.values()))
+        if oldest[0] >= now and len(self.sessions) <= self.max_sessions:
+          break
+        self.sessions.popitem(last=False)
+
+  def delete(self, session_id):
+    with self.lock:
+      self.sessions.pop(session_id, None)
+
+
+class SQLiteStore:
+
+  def __init__(self, path, ttl=3600):
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    with self.connection:
+      self.connection.execute('CREATE TABLE IF NOT EXISTS quiz_sessions '
+        '(id TEXT PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)')
+      self.connection.execute('CREATE INDEX IF NOT EXISTS ix_quiz_sessions_expires '
+        'ON quiz_sessions (expires)')
+
+  def get(self, session_id):
+    with self.lock:
+      row = self.connection.execute(
+        'SELECT state FROM quiz_sessions WHERE id = ? AND expires >= ?',
+        (session_id, time.time())).fetchone()
+    return json.loads(row[0]) if row else None
+
+  def set(self, session_id, state):
+    now = time.time()
+    with self.lock, self.connection:
+      self.connection.execute(
+        'INSERT OR REPLACE INTO quiz_sessions (id, state, expires) VALUES (?, ?, ?)',
+        (session_id, json.dumps(state, separators=(',', ':')), now + self.ttl))
+      self.connection.execute('DELETE FROM quiz_sessions WHERE expires < ?', (now,))
+
+  def delete(self, session_id):
+    with self.lock, self.connection:
+      self.connection.execute('DELETE FROM quiz_sessions WHERE id = ?', (session_id,))
+
+
+'''
+make_store(config)
+    builds the store named by QUIZ_SESSION_STORE ('memory' or 'sqlite')
+'''
+def make_store(config):
+  ttl = config.get('QUIZ_SESSION_TTL', 3600)
+  if config.get('QUIZ_SESSION_STORE', 'memory') == 'sqlite':
+    return SQLiteStore(config.get('QUIZ_SESSION_PATH', 'quiz_sessions.db'), ttl)
+  return MemoryStore(ttl, config.get('QUIZ_SESSION_MAX', 10000))
@@ -0,0 +1,35 @@
+--
+-- questions.category becomes an integer foreign key to categories.id, with
+-- the indexes used to list, count and draw questions of a category.
+--
+-- Safe to run on a database restored from trivia.psql (already an integer
+-- column) as well as on one created by db.create_all() before this change
+-- (a varchar column holding the category ids as text). From the backend
+-- folder:
+--
+--     psql trivia < migrations/0001_question_category_foreign_key.sql
+--
+
+BEGIN;
+
+ALTER TABLE public.questions DROP CONSTRAINT IF EXISTS category;
+
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer USING NULLIF(trim(category::text), '')::integer;
+
+-- questions pointing at a category that doesn't exist lose their category,
+-- as they would have with ON DELETE SET NULL
+UPDATE public.questions SET category = NULL
+    WHERE category IS NOT NULL
+    AND category NOT IN (SELECT id FROM public.categories);
+
+ALTER TABLE ONLY public.questions
+    ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id ON public.questions USING btree (category, id);
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty ON public.questions USING btree (category, difficulty);
+
+ANALYZE public.questions;
+
+COMMIT;
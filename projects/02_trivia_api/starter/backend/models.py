@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Index, create_engine, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 from dotenv import load_dotenv
@@ -9,9 +9,15 @@ database_path = os.environ.get("SQLALCHEMY_DATABASE_URI_BASE")+os.environ.get('D
 
 db = SQLAlchemy()
 
+# full-text document of a question on PostgreSQL, the 'simple' configuration
+# keeps every word (no stop words) so searches behave like the SQLite index
+SEARCH_CONFIG = 'simple'
+SEARCH_DOCUMENT = "to_tsvector('simple', coalesce(question, '') || ' ' || coalesce(answer, ''))"
+
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service,
+    and on PostgreSQL creates the GIN index used by question search
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
@@ -19,6 +25,10 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING GIN (%s)' % SEARCH_DOCUMENT))
 
 '''
 Question
@@ -30,9 +40,14 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  __table_args__ = (
+    Index('ix_questions_category_id', 'category', 'id'),
+    Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+  )
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -77,3 +92,69 @@ class Category(db.Model):
       'id': self.id,
       'type': self.type
     }
+
+
+'''
+QuizEvent
+    append-only log of quiz play: a question 'served' to a player, or
+    'answered' (correct or not, after seconds)
+'''
+class QuizEvent(db.Model):
+  __tablename__ = 'quiz_events'
+
+  id = Column(Integer, primary_key=True)
+  kind = Column(String(16), nullable=False)
+  question_id = Column(Integer, nullable=False)
+  category = Column(Integer)
+  difficulty = Column(Integer)
+  player = Column(String(80))
+  correct = Column(Boolean)
+  seconds = Column(Float)
+  created_at = Column(DateTime, nullable=False)
+
+'''
+QuizStat
+    quiz events rolled up per category and difficulty
+    (category 0 holds the questions without a category)
+'''
+class QuizStat(db.Model):
+  __tablename__ = 'quiz_stats'
+
+  category = Column(Integer, primary_key=True, autoincrement=False)
+  difficulty = Column(Integer, primary_key=True, autoincrement=False)
+  served = Column(Integer, nullable=False, default=0)
+  answered = Column(Integer, nullable=False, default=0)
+  correct = Column(Integer, nullable=False, default=0)
+  seconds = Column(Float, nullable=False, default=0)
+
+  def format(self):
+    return {
+      'category': self.category,
+      'difficulty': self.difficulty,
+      'served': self.served,
+      'answered': self.answered,
+      'correct': self.correct,
+      'average_seconds': self.seconds / self.answered if self.answered else None
+    }
+
+'''
+PlayerScore
+    quiz answers rolled up per player, for the leaderboard
+'''
+class PlayerScore(db.Model):
+  __tablename__ = 'quiz_leaderboard'
+
+  player = Column(String(80), primary_key=True)
+  answered = Column(Integer, nullable=False, default=0)
+  correct = Column(Integer, nullable=False, default=0)
+
+  __table_args__ = (
+    Index('ix_quiz_leaderboard_correct', 'correct'),
+  )
+
+  def format(self):
+    return {
+      'player': self.player,
+      'answered': self.answered,
+      'correct': self.correct
+    }
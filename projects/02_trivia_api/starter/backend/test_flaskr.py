@@ -1,11 +1,15 @@
+import io
 import os
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 
 from flaskr import create_app, QUESTIONS_PER_PAGE
-from models import setup_db, Question, Category
+from flaskr.analytics import QuizEvents
+from flaskr.bulk import read_rows, import_questions, ImportFailed
+from models import setup_db, db, Question, Category
 
 load_dotenv()
 
@@ -53,6 +57,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(len(data['categories']), 6)
 
+    def test_categories_reload_after_write(self):
+        app = create_app({'CACHE_CATEGORIES': True})
+        setup_db(app, self.database_path)
+        self.client = app.test_client
+        self.client().get('/categories')
+        category = Category('Test category')
+        db.session.add(category)
+        db.session.commit()
+        try:
+            data = json.loads(self.client().get('/categories').data)
+            self.assertEqual(data['categories'][str(category.id)], 'Test category')
+        finally:
+            db.session.delete(category)
+            db.session.commit()
+        data = json.loads(self.client().get('/categories').data)
+        self.assertEqual(len(data['categories']), 6)
+
     def test_retrieve_questions(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -62,6 +83,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertTrue(len(data['categories']))
     
+    def test_paginate_after_cursor(self):
+        first_page = json.loads(self.client().get('/questions?page=1').data)
+        last_id = first_page['questions'][-1]['id']
+        res = self.client().get('/questions?after={}'.format(last_id))
+        data = json.loads(res.data)
+        second_page = json.loads(self.client().get('/questions?page=2').data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['questions'], second_page['questions'])
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+
     def test_404_paginate_questions(self):
         res = self.client().get('/questions?page=1000')
         data = json.loads(res.data)
@@ -78,6 +109,16 @@ class TriviaTestCase(unittest.TestCase):
         data = json.loads(res.data)
         self.assertTrue(data['success'])
         self.assertEqual(Question.query.filter(Question.id == test_question_id).one_or_none(), None)
+        self.assertEqual(data['deleted'], test_question_id)
+        self.assertEqual(data['total_questions'], Question.query.count())
+        self.assertNotIn('questions', data)
+
+    def test_delete_question_full_response(self):
+        test_question = Question(question = 'test_delete', answer = 'test_delete_answer', category= 2, difficulty= 2)
+        test_question.insert()
+        res = self.client().delete('/questions/{}?response=full'.format(test_question.id))
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
         self.assertTrue(len(data['questions']))
         self.assertTrue(data['total_questions'])
 
@@ -104,10 +145,92 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(Question.query.count(), total_questions + 1)
         self.assertTrue(data['created'])
+        self.assertEqual(data['total_questions'], total_questions + 1)
+        self.assertNotIn('questions', data)
+
+    def test_add_question_adjusts_cached_total(self):
+        app = create_app({'CACHE_QUESTION_COUNTS': True})
+        setup_db(app, self.database_path)
+        client = app.test_client
+        # prime the cached count, the write must move it rather than recount
+        cached_total = json.loads(client().get('/questions').data)['total_questions']
+        data = json.loads(client().post('/questions/add', json = {
+            'question': 'This is for test',
+            'answer': 'Ok',
+            'difficulty': 2,
+            'category': 2
+        }).data)
+        self.assertEqual(data['total_questions'], cached_total + 1)
+        self.assertEqual(data['total_questions'], Question.query.count())
+        data = json.loads(client().get('/questions').data)
+        self.assertEqual(data['total_questions'], cached_total + 1)
+
+    def test_add_question_full_response(self):
+        res = self.client().post('/questions/add?response=full', json = {
+            'question': 'This is for test',
+            'answer': 'Ok',
+            'difficulty': 2,
+            'category': 2
+        })
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['created'])
         self.assertTrue(data['questions'])
         self.assertTrue(data['total_questions'])
         self.assertTrue(data['categories'])
     
+    def test_import_questions(self):
+        total_questions = Question.query.count()
+        lines = [
+            {'question': 'Bulk question one?', 'answer': 'One', 'category': 1, 'difficulty': 1},
+            {'question': 'Bulk question two?', 'answer': 'Two', 'category': 2, 'difficulty': 5},
+            {'question': 'Bulk question three?', 'answer': '', 'category': 2, 'difficulty': 5},
+            {'question': 'Bulk question four?', 'answer': 'Four', 'category': 20, 'difficulty': 1},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        try:
+            self.assertTrue(data['success'])
+            self.assertEqual(data['imported'], 2)
+            self.assertEqual([error['line'] for error in data['errors']], [3, 4, 5])
+            self.assertEqual(Question.query.count(), total_questions + 2)
+        finally:
+            Question.query.filter(Question.question.like('Bulk question%')).delete(synchronize_session=False)
+            db.session.commit()
+
+    def test_import_questions_csv(self):
+        body = 'question,answer,category,difficulty\n"Bulk, csv question?",Yes,3,2\n'
+        res = self.client().post('/questions/import?format=csv', data=body)
+        data = json.loads(res.data)
+        try:
+            self.assertEqual(data['imported'], 1)
+            self.assertEqual(Question.query.filter_by(question='Bulk, csv question?').one().category, 3)
+        finally:
+            Question.query.filter(Question.question.like('Bulk%')).delete(synchronize_session=False)
+            db.session.commit()
+
+    def test_import_questions_all_or_nothing(self):
+        total_questions = Question.query.count()
+        line = json.dumps({'question': 'Bulk question?', 'answer': 'Yes', 'category': 1, 'difficulty': 1})
+        body = (line + '\n').encode('utf-8') * 3 + b'\xff\xfe\n'
+        with self.assertRaises(ImportFailed) as failure:
+            import_questions(read_rows(io.BytesIO(body)), {1}, batch_size=1)
+        self.assertEqual(failure.exception.line, 3)
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual((data['imported'], data['line']), (0, 3))
+        self.assertEqual(Question.query.count(), total_questions)
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(rows), Question.query.count())
+        self.assertEqual(rows[0]['id'], Question.query.order_by(Question.id).first().id)
+
     def test_search_question(self):
         res = self.client().post('/questions', json = {'searchTerm': 'what'})
         data = json.loads(res.data)
@@ -116,6 +239,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions']))
         self.assertTrue(data['total_questions'])
 
+    def test_search_question_filters(self):
+        res = self.client().post('/questions', json = {'searchTerm': 'what', 'category': 2, 'difficulty': 3})
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
+        self.assertTrue(len(data['questions']))
+        self.assertLessEqual(len(data['questions']), QUESTIONS_PER_PAGE)
+        for question in data['questions']:
+            self.assertEqual(int(question['category']), 2)
+            self.assertEqual(question['difficulty'], 3)
+
+    def test_search_answer_and_new_question(self):
+        res = self.client().post('/questions/add', json = {
+            'question': 'Which search word is this?',
+            'answer': 'Zanzibarish',
+            'difficulty': 1,
+            'category': 1
+        })
+        created = json.loads(res.data)['created']
+        data = json.loads(self.client().post('/questions', json = {'searchTerm': 'zanzibarish'}).data)
+        self.assertEqual([question['id'] for question in data['questions']], [created])
+        self.client().delete('/questions/{}'.format(created))
+        data = json.loads(self.client().post('/questions', json = {'searchTerm': 'zanzibarish'}).data)
+        self.assertEqual(data['total_questions'], 0)
+
     def test_retrieve_by_category(self):
         current_category = 2
         res = self.client().get('/categories/{}/questions'.format(str(current_category)))
@@ -141,6 +288,149 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'])
+        self.assertNotIn(data['question']['id'], self.quiz_category['previous_questions'])
+        self.assertEqual(data['question']['category'], self.quiz_category['quiz_category']['id'])
+
+    def test_play_quiz_exhausted(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [question.id for question in Question.query.all()],
+            'quiz_category': {'type': 'click', 'id': 0}
+        })
+        data = json.loads(res.data.decode('utf-8'))
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(data['question'])
+
+    def test_play_quiz_draws_question_added_elsewhere(self):
+        category_ids = [q.id for q in Question.query.filter(Question.category == 4)]
+        self.client().post('/quizzes', json=self.quiz_category)
+        # added behind the app's back, as another worker would
+        question = Question('New?', 'Yes', 4, 1)
+        question.insert()
+        try:
+            res = self.client().post('/quizzes', json={
+                'previous_questions': category_ids,
+                'quiz_category': self.quiz_category['quiz_category']
+            })
+            self.assertEqual(json.loads(res.data)['question']['id'], question.id)
+            data = json.loads(self.client().post('/quizzes/sessions', json={
+                'quiz_category': self.quiz_category['quiz_category'],
+                'questions': 100
+            }).data)
+            self.assertEqual(data['total_questions'], len(category_ids) + 1)
+        finally:
+            question.delete()
+
+    def test_play_quiz_skips_deleted_question(self):
+        app = create_app({'CACHE_QUIZ_IDS': True})
+        setup_db(app, self.database_path)
+        self.client = app.test_client
+        question = Question('Gone?', 'Yes', 4, 1)
+        question.insert()
+        category_ids = [q.id for q in Question.query.filter(Question.category == 4)]
+        self.client().post('/quizzes', json=self.quiz_category)
+        # deleted behind the app's back, as another worker would
+        question.delete()
+        left = [id for id in category_ids if id != question.id]
+        res = self.client().post('/quizzes', json={
+            'previous_questions': left[1:],
+            'quiz_category': self.quiz_category['quiz_category']
+        })
+        data = json.loads(res.data.decode('utf-8'))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], left[0])
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': self.quiz_category['quiz_category'],
+            'questions': 2
+        })
+        data = json.loads(res.data)
+        self.assertTrue(data['success'])
+        session_id = data['session_id']
+        asked = []
+        for _ in range(data['total_questions']):
+            data = json.loads(self.client().post('/quizzes/sessions/{}/next'.format(session_id)).data)
+            self.assertNotIn('answer', data['question'])
+            asked.append(data['question']['id'])
+            answer = Question.query.get(data['question']['id']).answer
+            data = json.loads(self.client().post('/quizzes/sessions/{}/answer'.format(session_id),
+                                                 json={'answer': answer}).data)
+            self.assertTrue(data['correct'])
+        self.assertEqual(len(set(asked)), len(asked))
+        data = json.loads(self.client().post('/quizzes/sessions/{}/next'.format(session_id)).data)
+        self.assertFalse(data['question'])
+        data = json.loads(self.client().delete('/quizzes/sessions/{}'.format(session_id)).data)
+        self.assertEqual(data['score'], len(asked))
+        res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_session_clamped_to_category(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': self.quiz_category['quiz_category'],
+            'questions': 10 ** 9
+        })
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], Question.query.filter(Question.category == 4).count())
+
+    def test_400_quiz_session_answer_not_text(self):
+        data = json.loads(self.client().post('/quizzes/sessions', json=self.quiz_category).data)
+        self.client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+        res = self.client().post('/quizzes/sessions/{}/answer'.format(data['session_id']),
+                                 json={'answer': 42})
+        self.assertEqual(res.status_code, 400)
+
+    def test_422_quiz_session_answer_before_question(self):
+        data = json.loads(self.client().post('/quizzes/sessions', json=self.quiz_category).data)
+        res = self.client().post('/quizzes/sessions/{}/answer'.format(data['session_id']),
+                                 json={'answer': 'Ok'})
+        self.assertEqual(res.status_code, 422)
+
+    def quiz_stats(self, category):
+        data = json.loads(self.client().get('/quizzes/stats?category={}'.format(category)).data)
+        return {stat['difficulty']: stat for stat in data['stats']}
+
+    def test_quiz_stats_and_leaderboard(self):
+        category = self.quiz_category['quiz_category']['id']
+        before = self.quiz_stats(category)
+        data = json.loads(self.client().post('/quizzes/sessions', json={
+            'quiz_category': self.quiz_category['quiz_category'],
+            'questions': 1,
+            'player': 'test player'
+        }).data)
+        session_id = data['session_id']
+        question = json.loads(self.client().post('/quizzes/sessions/{}/next'.format(session_id)).data)['question']
+        answer = Question.query.get(question['id']).answer
+        self.client().post('/quizzes/sessions/{}/answer'.format(session_id), json={'answer': answer})
+
+        after = self.quiz_stats(category)[question['difficulty']]
+        previous = before.get(question['difficulty'], {'served': 0, 'answered': 0, 'correct': 0})
+        self.assertEqual(after['served'], previous['served'] + 1)
+        self.assertEqual(after['answered'], previous['answered'] + 1)
+        self.assertEqual(after['correct'], previous['correct'] + 1)
+        self.assertIsNotNone(after['average_seconds'])
+
+        data = json.loads(self.client().get('/quizzes/leaderboard?limit=100').data)
+        self.assertIn('test player', [player['player'] for player in data['leaderboard']])
+
+    def test_quiz_events_flush_failure_keeps_events(self):
+        events = QuizEvents(flush_size=1)
+        question = Question.query.first()
+        with mock.patch('flaskr.analytics.add_deltas', side_effect=RuntimeError('database down')):
+            with self.assertLogs('flaskr.analytics', 'ERROR'):
+                events.record('served', question)
+        self.assertEqual(len(events.buffer), 1)
+        self.assertEqual(events.flush(), 1)
+
+    def test_rebuild_quiz_stats(self):
+        self.client().post('/quizzes', json=self.quiz_category)
+        counts = lambda stats: [(stat['category'], stat['difficulty'], stat['served'], stat['answered'], stat['correct'])
+                                for stat in stats]
+        before = json.loads(self.client().get('/quizzes/stats').data)['stats']
+        result = self.app.test_cli_runner().invoke(args=['rebuild-quiz-stats'])
+        self.assertIsNone(result.exception)
+        after = json.loads(self.client().get('/quizzes/stats').data)['stats']
+        self.assertTrue(before)
+        self.assertEqual(counts(before), counts(after))
 
 
 
@@ -0,0 +1,212 @@
+'''
+Benchmarks for the coffee shop API.
+
+    python benchmarks.py serialize --rows 10000
+        time spent turning 10k drinks into the JSON of GET /drinks and
+        GET /drinks-detail, ORM objects + jsonify against row tuples + the
+        serializers (with orjson if it is installed, then the json module)
+
+    python benchmarks.py menu --rows 1000
+        GET /drinks served from the menu snapshot (200 and 304) against
+        serializing the drinks on every request
+
+    python benchmarks.py auth --requests 2000
+        auth overhead per request of @requires_auth, with the verified-token
+        cache on and off. Tokens are signed with a key generated on the spot
+        and checked against it through AUTH0_JWKS_FILE, Auth0 isn't called.
+
+The benchmarks run against their own database (in-memory SQLite by
+default), importing src.api would reset src/database/database.db.
+'''
+import os
+import json
+import time
+import base64
+import random
+import argparse
+import tempfile
+from flask import Flask, jsonify
+from jose import jwt
+
+from src.database.models import setup_db, db, Drink, Ingredient, recipe_projections
+from src import serializers, menu
+from src.serializers import drink_rows, stream_array, drink_json, SHORT_COLUMNS, LONG_COLUMNS
+
+COLORS = ['brown', 'white', 'black', 'grey', 'beige', 'orange', 'red']
+INGREDIENTS = ['espresso', 'milk', 'foam', 'water', 'chocolate', 'cream', 'syrup', 'ice']
+
+
+def create_bench_app(database_uri):
+    app = Flask(__name__)
+    setup_db(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    return app
+
+
+def seed_drinks(count, seed=0):
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+    drinks = []
+    ingredients = []
+    for n in range(count):
+        recipe = [{'color': rng.choice(COLORS), 'name': rng.choice(INGREDIENTS), 'parts': rng.randint(1, 4)}
+                  for _ in range(rng.randint(1, 3))]
+        short_recipe, long_recipe = recipe_projections(recipe)
+        drinks.append({'id': n + 1, 'title': 'drink %d' % n, 'short_recipe': short_recipe, 'long_recipe': long_recipe})
+        ingredients.extend(dict(r, drink_id=n + 1, position=position) for position, r in enumerate(recipe))
+    db.session.execute(Drink.__table__.insert(), drinks)
+    db.session.execute(Ingredient.__table__.insert(), ingredients)
+    db.session.commit()
+
+
+def bench_serialize(args):
+    app = create_bench_app(args.database_uri)
+    with app.test_request_context():
+        if not args.skip_seed:
+            seed_drinks(args.rows)
+
+        def orm_jsonify(form):
+            return jsonify({'success': True, 'drinks': [form(drink) for drink in Drink.query.all()]}).get_data()
+
+        paths = {
+            'GET /drinks         orm+jsonify': lambda: orm_jsonify(Drink.short),
+            'GET /drinks         rows+serializers': lambda: b''.join(
+                stream_array('drinks', drink_rows(SHORT_COLUMNS), drink_json)),
+            'GET /drinks-detail  orm+jsonify': lambda: orm_jsonify(Drink.long),
+            'GET /drinks-detail  rows+serializers': lambda: b''.join(
+                stream_array('drinks', drink_rows(LONG_COLUMNS), drink_json)),
+        }
+        encoders = [('orjson', serializers.orjson)] if serializers.orjson is not None else []
+        encoders.append(('json', None))
+        for encoder, module in encoders:
+            serializers.orjson = module
+            for name, run in paths.items():
+                if encoder != encoders[0][0] and 'serializers' not in name:
+                    continue
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+                    db.session.remove()
+                print('%-38s %-7s %8.1fms per 10k rows' % (
+                    name, encoder if 'serializers' in name else '', min(timings) * 1000 * 10000 / args.rows))
+
+
+def bench_menu(args):
+    app = create_bench_app(args.database_uri)
+    with app.test_request_context():
+        if not args.skip_seed:
+            seed_drinks(args.rows)
+    drinks_menu = menu.Menu()
+    with app.test_request_context():
+        etag = drinks_menu.view('short')[1]
+
+    paths = {
+        'serialize every request': ({}, lambda: b''.join(stream_array('drinks', drink_rows(SHORT_COLUMNS), drink_json))),
+        'menu snapshot       200': ({}, lambda: drinks_menu.response('short')),
+        'menu snapshot       304': ({'If-None-Match': '"%s"' % etag}, lambda: drinks_menu.response('short')),
+    }
+    for name, (headers, run) in paths.items():
+        timings = []
+        for _ in range(args.repeat):
+            with app.test_request_context('/drinks', headers=headers):
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    run()
+                timings.append(time.perf_counter() - start)
+            db.session.remove()
+        print('%-26s %10.1fus per request (%d drinks)' % (name, min(timings) * 1e6 / args.requests, args.rows))
+
+
+def generate_signing_key():
+    '''returns (private key PEM, n, e) of a new RSA key'''
+    try:
+        from Crypto.PublicKey import RSA
+        key = RSA.generate(2048)
+        return key.export_key('PEM').decode(), key.n, key.e
+    except ImportError:
+        import rsa
+        public, private = rsa.newkeys(2048)
+        return private.save_pkcs1().decode(), public.n, public.e
+
+
+def b64_uint(value):
+    return base64.urlsafe_b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+def bench_auth(args):
+    pem, n, e = generate_signing_key()
+    jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    with jwks_file:
+        json.dump({'keys': [{'kty': 'RSA', 'kid': 'bench', 'use': 'sig', 'n': b64_uint(n), 'e': b64_uint(e)}]}, jwks_file)
+    os.environ['AUTH0_JWKS_FILE'] = jwks_file.name
+    from src.auth import auth
+
+    tokens = [jwt.encode({
+        'iss': 'https://%s/' % auth.AUTH0_DOMAIN,
+        'aud': auth.API_AUDIENCE,
+        'sub': 'bench|%d' % n,
+        'exp': int(time.time()) + 3600,
+        'permissions': ['get:drinks-detail', 'post:drinks']
+    }, pem, algorithm='RS256', headers={'kid': 'bench'}) for n in range(args.tokens)]
+
+    app = Flask(__name__)
+    endpoint = auth.requires_auth('get:drinks-detail')(lambda payload: payload)
+
+    def run(view):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for i in range(args.requests):
+                headers = {'Authorization': 'Bearer ' + tokens[i % len(tokens)]}
+                with app.test_request_context(headers=headers):
+                    view()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1e6 / args.requests
+
+    try:
+        # the request context alone, taken off the timings below
+        baseline = run(lambda: None)
+        for cache_size in (0, args.cache_size):
+            auth.verified_tokens = auth.TokenCache(cache_size)
+            print('cache %-4s %8.1fus auth overhead per request  %s' % (
+                'on' if cache_size else 'off', run(endpoint) - baseline, auth.verified_tokens.stats()))
+    finally:
+        os.unlink(jwks_file.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serialize = commands.add_parser('serialize', help='JSON serialization cost of the drink lists')
+    serialize.add_argument('--database-uri', default='sqlite://', help='in-memory SQLite by default')
+    serialize.add_argument('--rows', type=int, default=10000)
+    serialize.add_argument('--repeat', type=int, default=5)
+    serialize.add_argument('--skip-seed', action='store_true', help='reuse the drinks already loaded')
+    serialize.set_defaults(run=bench_serialize)
+
+    menu_parser = commands.add_parser('menu', help='GET /drinks from the menu snapshot against serializing per request')
+    menu_parser.add_argument('--database-uri', default='sqlite://', help='in-memory SQLite by default')
+    menu_parser.add_argument('--rows', type=int, default=1000)
+    menu_parser.add_argument('--requests', type=int, default=200)
+    menu_parser.add_argument('--repeat', type=int, default=3)
+    menu_parser.add_argument('--skip-seed', action='store_true', help='reuse the drinks already loaded')
+    menu_parser.set_defaults(run=bench_menu)
+
+    auth = commands.add_parser('auth', help='@requires_auth overhead with the verified-token cache on and off')
+    auth.add_argument('--requests', type=int, default=2000)
+    auth.add_argument('--tokens', type=int, default=10, help='distinct bearer tokens, used round robin')
+    auth.add_argument('--cache-size', type=int, default=1024)
+    auth.add_argument('--repeat', type=int, default=3)
+    auth.set_defaults(run=bench_auth)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
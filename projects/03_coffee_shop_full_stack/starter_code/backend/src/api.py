@@ -1,16 +1,19 @@
 import os
 from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
 from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .auth.auth import AuthError, requires_auth, cache_stats
+from .menu import Menu
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
+# the drink lists, served from memory until the drinks change
+menu = Menu()
+
 
 '''
 DONE
@@ -29,21 +32,16 @@ DONE
         it should contain only the drink.short() data representation
         returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+        returns status code 304 if the If-None-Match header has the ETag of the current list
 '''
 @app.route('/drinks')
 def get_drinks():
     #@TODO: implement errors
-    drinks = []
     try:
-        drinks_obj = Drink.query.all()
+        return menu.response('short')
     except Exception as e:
         print(e)
         abort(422)
-    drinks = [drink.short() for drink in drinks_obj]
-    return jsonify({
-        "success": True, 
-        "drinks": drinks
-        }), 200
 
 '''
 DONE
@@ -53,22 +51,17 @@ DONE
         it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+        returns status code 304 if the If-None-Match header has the ETag of the current list
 '''
 @app.route('/drinks-detail')
 @requires_auth('get:drinks-detail')
 def get_drinks_detail(payload):
     #@TODO: implemenet errors and status code
-    drinks = []
     try:
-        drinks_obj = Drink.query.all()
+        return menu.response('long')
     except Exception as e:
         print(e)
         abort(422)
-    drinks = [drink.long() for drink in drinks_obj]
-    return jsonify({
-        "success": True, 
-        "drinks": drinks
-        }), 200
 
 '''
 DONE
@@ -86,7 +79,7 @@ def create_drinks(payload):
     drink_title = request.json.get('title')
     drink_recipe = request.json.get('recipe')
     try:
-        new_drink = Drink(title = drink_title, recipe = json.dumps(drink_recipe))
+        new_drink = Drink(title = drink_title, recipe = drink_recipe)
         new_drink.insert()
     except Exception as e:
         print(e)
@@ -117,8 +110,8 @@ def update_drink(payload, id):
         drink = Drink.query.get(id)
         
         drink.title = body.get('title', drink.title)
-        recipe = json.dumps(body.get('recipe'))
-        drink.recipe = recipe if recipe != 'null' else drink.recipe
+        if body.get('recipe') is not None:
+            drink.recipe = body['recipe']
         drink.update()
     except Exception as e:
         print(e)
@@ -158,6 +151,15 @@ def delete_drink(payload, id):
         "delete": id
     }), 200
 
+'''
+GET /metrics/auth
+    a public endpoint for operators: hits, misses and size of the
+    verified-token cache, and the state of the cached signing keys
+'''
+@app.route('/metrics/auth')
+def auth_metrics():
+    return jsonify(dict(cache_stats(), success=True))
+
 ## Error Handling
 '''
 Example error handling for unprocessable entity
@@ -1,14 +1,47 @@
-import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import KeyStore
+from .tokens import TokenCache
+from .permissions import requirement, granted
 
 
 AUTH0_DOMAIN = 'fsnd-hamed.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'http://localhost:5000'
 
+'''
+jwks
+    the Auth0 signing keys, cached by kid for AUTH0_JWKS_TTL seconds.
+    Set AUTH0_JWKS_FILE to read the key set from a local file instead,
+    e.g. to run against a stand-in key set in tests.
+'''
+jwks = KeyStore(
+    url=f'https://{AUTH0_DOMAIN}/.well-known/jwks.json',
+    path=os.environ.get('AUTH0_JWKS_FILE'),
+    ttl=int(os.environ.get('AUTH0_JWKS_TTL', 3600))
+)
+
+'''
+verified_tokens
+    the payloads of tokens we already verified, until they expire.
+    AUTH_TOKEN_CACHE_SIZE=0 turns it off, verified_tokens.stats() has the
+    hit and miss counts.
+'''
+verified_tokens = TokenCache(int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024)))
+
+'''
+cache_stats()
+    the verified_tokens and jwks counters, served on GET /metrics/auth
+'''
+def cache_stats():
+    return {
+        'token_cache': verified_tokens.stats(),
+        'jwks': jwks.stats()
+    }
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -62,22 +95,26 @@ def get_token_auth_header():
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or a Requirement
+            (i.e. all_of('get:drinks-detail', 'patch:drinks'), any_of(...))
         payload: decoded jwt payload
+        permissions: the payload permissions as a frozenset, if we have them already
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    if "permissions" not in payload:
+def check_permissions(permission, payload, permissions=None):
+    if permissions is None:
+        permissions = granted(payload)
+    if permissions is None:
         raise AuthError({
             'code':'permissions_missing',
             'description': 'permissions are expected'
             }, 403)
     
-    elif permission not in payload['permissions']:
+    elif not requirement(permission).satisfied_by(permissions):
         raise AuthError({
             'code':'not_authorized',
             'description': 'permission is expected'
@@ -92,7 +129,7 @@ def check_permissions(permission, payload):
         token: a json web token (string)
 
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
+    it should verify the token using Auth0 /.well-known/jwks.json (cached in jwks)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -100,25 +137,14 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code':'invalid_header',
             'description': 'Token not found!'
             }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks.get(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -156,20 +182,29 @@ def verify_decode_jwt(token):
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or a Requirement
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        (unless the token is in verified_tokens)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
+    required = requirement(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            cached = verified_tokens.get(token)
+            if cached is None:
+                payload = verify_decode_jwt(token)
+                permissions = granted(payload)
+                verified_tokens.put(token, payload, permissions)
+            else:
+                payload, permissions = cached
+            check_permissions(required, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
@@ -0,0 +1,128 @@
+import json
+import time
+import threading
+from urllib.request import urlopen
+
+'''
+KeyStore
+    the signing keys of a JSON Web Key Set, by key id (kid), fetched from
+    url (or read from a local file at path, e.g. a stand-in key set for
+    tests) and kept for ttl seconds.
+
+    Keys older than refresh_after seconds are still served while a
+    background thread fetches the set again. A kid that isn't in the set
+    triggers an immediate fetch, at most once every min_refresh_interval
+    seconds so random kids can't make us hammer the key server. However
+    many requests miss at the same time, only one fetch runs; the others
+    wait for its result.
+
+    A failed fetch keeps the keys we had, even past ttl, and no fetch is
+    tried again for retry_after seconds, so a key server outage doesn't
+    put a blocking fetch in front of every request.
+'''
+class KeyStore:
+
+    def __init__(self, url=None, path=None, ttl=3600, refresh_after=None,
+                 min_refresh_interval=30, timeout=5, retry_after=30):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.refresh_after = refresh_after if refresh_after is not None else ttl * 0.8
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.keys = {}
+        self.fetched_at = None
+        self.attempted_at = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+        self.inflight = None
+
+    '''
+    load()
+        returns the {kid: key} dict of the current key set
+    '''
+    def load(self):
+        if self.path:
+            with open(self.path) as f:
+                jwks = json.load(f)
+        else:
+            with urlopen(self.url, timeout=self.timeout) as response:
+                jwks = json.loads(response.read())
+        return {key['kid']: {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key.get('use', 'sig'),
+            'n': key['n'],
+            'e': key['e']
+        } for key in jwks['keys'] if key.get('kty') == 'RSA'}
+
+    '''
+    refresh(wait=True)
+        fetches the key set, or joins the fetch already running.
+        Fetch errors keep the keys we had.
+    '''
+    def refresh(self, wait=True):
+        with self.lock:
+            inflight = self.inflight
+            if inflight is None:
+                inflight = self.inflight = threading.Event()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            if wait:
+                inflight.wait(self.timeout)
+            return
+        try:
+            self.attempted_at = time.time()
+            self.keys = self.load()
+            self.fetched_at = time.time()
+            self.failed_at = None
+        except Exception:
+            self.failed_at = time.time()
+        finally:
+            with self.lock:
+                self.inflight = None
+            inflight.set()
+
+    def refresh_in_background(self):
+        if self.inflight is None:
+            threading.Thread(target=self.refresh, kwargs={'wait': False}, daemon=True).start()
+
+    '''
+    get(kid)
+        returns the key with id kid, or None if the key set doesn't have it
+    '''
+    def get(self, kid):
+        now = time.time()
+        age = now - self.fetched_at if self.fetched_at is not None else None
+        # after a failed fetch, serve the keys we have until retry_after
+        backing_off = self.failed_at is not None and now - self.failed_at < self.retry_after
+        if backing_off:
+            pass
+        elif age is None or age >= self.ttl:
+            self.refresh()
+        elif age >= self.refresh_after:
+            self.refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None and not backing_off and (
+                self.attempted_at is None
+                or now - self.attempted_at >= self.min_refresh_interval):
+            # the signing key may have been rotated since our last fetch
+            self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    '''
+    stats()
+        the number of keys held, their age in seconds and whether the last
+        fetch failed
+    '''
+    def stats(self):
+        return {
+            'keys': len(self.keys),
+            'age': time.time() - self.fetched_at if self.fetched_at is not None else None,
+            'fetch_failed': self.failed_at is not None
+        }
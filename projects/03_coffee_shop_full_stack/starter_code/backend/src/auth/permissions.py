@@ -0,0 +1,53 @@
+'''
+Permission requirements of the protected routes.
+    A token's permissions are turned into a frozenset once, when the token
+    is verified (and cached with its payload), so checking a requirement is
+    a couple of set operations instead of list scans.
+'''
+
+
+'''
+Requirement
+    the permissions a route needs: every permission in all_of and, if any_of
+    isn't empty, at least one of any_of
+'''
+class Requirement:
+
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    def satisfied_by(self, granted):
+        return self.all_of <= granted and (not self.any_of or not self.any_of.isdisjoint(granted))
+
+    def __repr__(self):
+        return 'Requirement(all_of=%r, any_of=%r)' % (sorted(self.all_of), sorted(self.any_of))
+
+
+def all_of(*permissions):
+    return Requirement(all_of=permissions)
+
+
+def any_of(*permissions):
+    return Requirement(any_of=permissions)
+
+
+'''
+requirement(permission)
+    a Requirement as it is, or the Requirement of a single permission string
+'''
+def requirement(permission):
+    if isinstance(permission, Requirement):
+        return permission
+    return Requirement(all_of=(permission,))
+
+
+'''
+granted(payload)
+    the permissions of a decoded token as a frozenset, None if the token
+    has no permissions claim
+'''
+def granted(payload):
+    if 'permissions' not in payload:
+        return None
+    return frozenset(payload['permissions'])
@@ -0,0 +1,81 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+'''
+TokenCache
+    the decoded payloads of tokens that passed verification, with their
+    permissions as a frozenset, keyed by the sha256 of the token and kept
+    until the token's exp, so a client sending the same bearer token again
+    skips the signature check.
+    Holds at most max_size tokens, dropping the least recently used.
+    A max_size of 0 turns the cache off.
+'''
+class TokenCache:
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    '''
+    get(token)
+        returns the cached (payload, permissions) of token, or None if it
+        has to be verified
+    '''
+    def get(self, token):
+        if not self.max_size:
+            return None
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.time():
+                del self.entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    '''
+    put(token, payload, permissions)
+        caches the payload and permissions of a verified token. Tokens
+        without an exp claim are never cached.
+    '''
+    def put(self, token, payload, permissions=None):
+        if not self.max_size or not isinstance(payload.get('exp'), (int, float)):
+            return
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (payload['exp'], payload, permissions)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
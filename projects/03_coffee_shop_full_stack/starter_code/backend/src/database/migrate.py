@@ -0,0 +1,42 @@
+'''
+Moves a database from the recipe blob format (drink.recipe holding the JSON
+of the ingredients) to the ingredients table and the precomputed
+short_recipe / long_recipe projections, and adds the menu_version table.
+
+    python -m src.database.migrate [database file]
+
+The database file defaults to src/database/database.db. Databases that
+are already migrated are left alone.
+'''
+import os
+import sys
+from sqlalchemy import create_engine, inspect
+
+from .models import Drink, Ingredient, MenuVersion, normalize_recipe, recipe_projections, project_dir, database_filename
+
+
+def migrate(engine):
+    MenuVersion.__table__.create(engine, checkfirst=True)
+    if 'recipe' not in [column['name'] for column in inspect(engine).get_columns('drink')]:
+        return 0
+    with engine.begin() as connection:
+        drinks = connection.execute('SELECT id, title, recipe FROM drink ORDER BY id').fetchall()
+        connection.execute('ALTER TABLE drink RENAME TO drink_blob')
+        Drink.__table__.create(connection)
+        Ingredient.__table__.create(connection, checkfirst=True)
+        for id, title, blob in drinks:
+            ingredients = normalize_recipe(blob)
+            short_recipe, long_recipe = recipe_projections(ingredients)
+            connection.execute(Drink.__table__.insert(), {
+                'id': id, 'title': title, 'short_recipe': short_recipe, 'long_recipe': long_recipe})
+            if ingredients:
+                connection.execute(Ingredient.__table__.insert(), [
+                    dict(r, drink_id=id, position=position) for position, r in enumerate(ingredients)])
+        connection.execute('DROP TABLE drink_blob')
+    return len(drinks)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(project_dir, database_filename)
+    count = migrate(create_engine('sqlite:///' + os.path.abspath(path)))
+    print('migrated %d drinks' % count)
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, Index, DDL, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -29,6 +29,43 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+normalize_recipe(recipe)
+    the ingredients of recipe as [{'color': string, 'name': string, 'parts': int}]
+    recipe can be a list of ingredients, a single ingredient or the JSON of
+    either (the old recipe blob). Raises ValueError if an ingredient is incomplete.
+'''
+def normalize_recipe(recipe):
+    if isinstance(recipe, str):
+        recipe = json.loads(recipe)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list):
+        raise ValueError('recipe should be a list of ingredients')
+    ingredients = []
+    for r in recipe:
+        if not isinstance(r, dict) or not all(key in r for key in ('color', 'name', 'parts')):
+            raise ValueError('ingredients need a color, a name and parts')
+        if not isinstance(r['parts'], int) or isinstance(r['parts'], bool):
+            raise ValueError('parts should be a whole number')
+        ingredients.append({'color': str(r['color']), 'name': str(r['name']), 'parts': r['parts']})
+    return ingredients
+
+
+def dump_recipe(recipe):
+    return json.dumps(recipe, ensure_ascii=False, separators=(',', ':'))
+
+
+'''
+recipe_projections(ingredients)
+    the JSON of the short and long form recipes of normalized ingredients,
+    stored with the drink so listing drinks doesn't have to build them
+'''
+def recipe_projections(ingredients):
+    short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in ingredients]
+    return dump_recipe(short_recipe), dump_recipe(ingredients)
+
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,21 +75,39 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the recipe as JSON in short and long form, precomputed from the
+    # ingredients whenever the recipe is set
+    short_recipe = Column(Text, nullable=False)
+    long_recipe = Column(Text, nullable=False)
+    ingredients = db.relationship('Ingredient', order_by='Ingredient.position',
+                                  cascade='all, delete-orphan', backref='drink', lazy='selectin')
+
+    '''
+    recipe
+        the ingredients as [{'color': string, 'name':string, 'parts':number}]
+        setting it replaces the ingredients and the stored projections
+        EXAMPLE
+            drink = Drink(title='Water', recipe=[{'color': 'blue', 'name': 'Water', 'parts': 1}])
+    '''
+    @property
+    def recipe(self):
+        return [ingredient.long() for ingredient in self.ingredients]
+
+    @recipe.setter
+    def recipe(self, recipe):
+        ingredients = normalize_recipe(recipe)
+        self.ingredients = [Ingredient(position=position, **r) for position, r in enumerate(ingredients)]
+        self.short_recipe, self.long_recipe = recipe_projections(ingredients)
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': [ingredient.short() for ingredient in self.ingredients]
         }
 
     '''
@@ -63,7 +118,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
     '''
@@ -104,4 +159,45 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+'''
+Ingredient
+one ingredient of a drink's recipe, in recipe order (position)
+'''
+class Ingredient(db.Model):
+    __tablename__ = 'ingredients'
+    __table_args__ = (
+        Index('ix_ingredients_drink_position', 'drink_id', 'position'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), nullable=False)
+    position = Column(Integer, nullable=False)
+    name = Column(String(80), nullable=False)
+    color = Column(String(80), nullable=False)
+    parts = Column(Integer, nullable=False)
+
+    def short(self):
+        return {'color': self.color, 'parts': self.parts}
+
+    def long(self):
+        return {'color': self.color, 'name': self.name, 'parts': self.parts}
+
+
+'''
+MenuVersion
+the single row version of the drink menu, bumped in the same transaction
+as every drink write so each worker process can tell its menu snapshot is
+out of date (see src/menu.py)
+'''
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+event.listen(MenuVersion.__table__, 'after_create',
+             DDL('INSERT INTO menu_version (id, version) VALUES (1, 0)'))
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from flask import current_app, request
+from sqlalchemy import event
+
+from .database.models import db, Drink, Ingredient, MenuVersion
+from .serializers import drink_rows, drink_json, stream_array, SHORT_COLUMNS, LONG_COLUMNS
+
+VIEWS = {'short': SHORT_COLUMNS, 'long': LONG_COLUMNS}
+
+menu_version = MenuVersion.__table__
+
+
+'''
+bump_version(connection)
+    marks every worker's menu as out of date. Drink writes through the
+    session call it from the flush; writes made around the ORM should call
+    it in their own transaction.
+'''
+def bump_version(connection):
+    connection.execute(menu_version.update().where(menu_version.c.id == 1).values(
+        version=menu_version.c.version + 1))
+
+
+@event.listens_for(db.session, 'after_flush')
+def drinks_flushed(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Drink, Ingredient)):
+            bump_version(session.connection())
+            return
+
+
+'''
+Menu
+    the drink lists, read once and kept as ready made response bodies for
+    the short (GET /drinks) and long (GET /drinks-detail) views, each with
+    a strong ETag of its bytes. Each read checks the shared menu_version
+    row, a single primary key lookup, and only rebuilds the lists after a
+    drink write made by any worker.
+'''
+class Menu:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = None
+
+    def load(self):
+        # read before the drinks, so lists built from newer rows are at
+        # worst rebuilt once more, never kept under a newer version
+        version = db.session.query(MenuVersion.version).filter(MenuVersion.id == 1).scalar()
+        with self.lock:
+            if self.loaded is None or self.loaded[0] != version:
+                views = {}
+                for name, columns in VIEWS.items():
+                    body = b''.join(stream_array('drinks', drink_rows(columns), drink_json))
+                    views[name] = (body, hashlib.sha256(body).hexdigest()[:32])
+                self.loaded = (version, views)
+            return self.loaded
+
+    '''
+    view(name)
+        the (body, etag) of the 'short' or 'long' drink list
+    '''
+    def view(self, name):
+        return self.load()[1][name]
+
+    '''
+    response(name)
+        the drink list as a response, or an empty 304 Not Modified if the
+        request's If-None-Match has its ETag
+    '''
+    def response(self, name):
+        body, etag = self.view(name)
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
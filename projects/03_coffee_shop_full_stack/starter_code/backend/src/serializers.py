@@ -0,0 +1,57 @@
+import json
+
+from .database.models import db, Drink
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+Serialization of the drink lists.
+    Drinks are selected as plain (id, title, recipe) row tuples instead of
+    ORM objects and encoded straight to bytes, with orjson when it is
+    installed and the standard json module otherwise. The recipe is the
+    short or long form JSON stored with the drink, spliced in as it is.
+'''
+SHORT_COLUMNS = (Drink.id, Drink.title, Drink.short_recipe)
+LONG_COLUMNS = (Drink.id, Drink.title, Drink.long_recipe)
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+'''
+drink_rows(columns, batch_size)
+    the rows of every drink (SHORT_COLUMNS or LONG_COLUMNS), fetched
+    batch_size at a time. The query is executed right away so database
+    errors surface before streaming starts.
+'''
+def drink_rows(columns=SHORT_COLUMNS, batch_size=500):
+    return iter(db.session.query(*columns).order_by(Drink.id).yield_per(batch_size))
+
+
+def drink_json(row):
+    return b'{"id":%d,"title":%s,"recipe":%s}' % (row[0], dumps(row[1]), row[2].encode('utf-8'))
+
+
+'''
+stream_array(key, rows, encode, chunk_size)
+    yields {"success": true, key: [...]} with every row encoded by encode,
+    chunk_size rows at a time, so large lists are never built in memory
+'''
+def stream_array(key, rows, encode, chunk_size=500):
+    yield b'{"success":true,' + dumps(key) + b':['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            chunk, first = [], False
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']}'
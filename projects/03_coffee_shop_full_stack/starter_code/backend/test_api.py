@@ -0,0 +1,241 @@
+'''
+Tests of the auth caches and the drink menu snapshot.
+
+They run without Auth0 and leave src/database/database.db alone: tokens are
+signed with a key generated here and checked against a local key set, and
+the menu is served from its own in-memory database (importing src.api would
+reset the real one).
+'''
+import os
+import json
+import time
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from jose import jwt
+
+from src.auth import auth
+from src.auth.auth import AuthError, check_permissions, requires_auth
+from src.auth.jwks import KeyStore
+from src.auth.tokens import TokenCache
+from src.auth.permissions import all_of, any_of, granted
+from src.database.models import setup_db, db, Drink
+from src.menu import Menu, bump_version
+from benchmarks import generate_signing_key, b64_uint
+
+
+def write_key_set(path, keys):
+    with open(path, 'w') as f:
+        json.dump({'keys': [dict(key, kty='RSA', use='sig') for key in keys]}, f)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def test_hit_until_expiry(self):
+        cache = TokenCache(10)
+        payload = {'sub': 'a', 'exp': time.time() + 60}
+        cache.put('token', payload, frozenset(['get:drinks-detail']))
+        self.assertEqual(cache.get('token'), (payload, frozenset(['get:drinks-detail'])))
+        cache.entries[cache.key('token')] = (time.time() - 1, payload, None)
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache.entries), 0)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expired']), (1, 1, 1))
+
+    def test_least_recently_used_dropped(self):
+        cache = TokenCache(2)
+        for token in ('a', 'b'):
+            cache.put(token, {'exp': time.time() + 60})
+        cache.get('a')
+        cache.put('c', {'exp': time.time() + 60})
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+
+    def test_not_cached(self):
+        cache = TokenCache(10)
+        cache.put('no exp', {'sub': 'a'})
+        self.assertIsNone(cache.get('no exp'))
+        cache = TokenCache(0)
+        cache.put('token', {'exp': time.time() + 60})
+        self.assertIsNone(cache.get('token'))
+
+
+class PermissionsTestCase(unittest.TestCase):
+
+    def test_all_of(self):
+        requirement = all_of('get:drinks-detail', 'patch:drinks')
+        self.assertTrue(requirement.satisfied_by(frozenset(['get:drinks-detail', 'patch:drinks', 'post:drinks'])))
+        self.assertFalse(requirement.satisfied_by(frozenset(['get:drinks-detail'])))
+
+    def test_any_of(self):
+        requirement = any_of('patch:drinks', 'delete:drinks')
+        self.assertTrue(requirement.satisfied_by(frozenset(['delete:drinks'])))
+        self.assertFalse(requirement.satisfied_by(frozenset(['get:drinks-detail'])))
+        self.assertFalse(requirement.satisfied_by(frozenset()))
+
+    def test_check_permissions(self):
+        payload = {'permissions': ['get:drinks-detail']}
+        self.assertTrue(check_permissions('get:drinks-detail', payload))
+        self.assertTrue(check_permissions(any_of('post:drinks', 'get:drinks-detail'), payload, granted(payload)))
+        with self.assertRaises(AuthError) as error:
+            check_permissions(all_of('get:drinks-detail', 'post:drinks'), payload)
+        self.assertEqual(error.exception.status_code, 403)
+        with self.assertRaises(AuthError):
+            check_permissions('get:drinks-detail', {})
+
+
+class KeyStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        write_key_set(self.path, [{'kid': 'k1', 'n': 'n1', 'e': 'AQAB'}])
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_rotated_kid_fetched(self):
+        keys = KeyStore(path=self.path, min_refresh_interval=0)
+        self.assertEqual(keys.get('k1')['n'], 'n1')
+        self.assertIsNone(keys.get('k2'))
+        write_key_set(self.path, [{'kid': 'k2', 'n': 'n2', 'e': 'AQAB'}])
+        self.assertEqual(keys.get('k2')['n'], 'n2')
+        self.assertIsNone(keys.get('k1'))
+
+    def test_unknown_kid_fetches_rate_limited(self):
+        keys = KeyStore(path=self.path, min_refresh_interval=60)
+        keys.get('k1')
+        write_key_set(self.path, [{'kid': 'k2', 'n': 'n2', 'e': 'AQAB'}])
+        self.assertIsNone(keys.get('k2'))
+
+    def test_stale_keys_served_after_failed_fetch(self):
+        keys = KeyStore(path=self.path, ttl=60, retry_after=60)
+        keys.get('k1')
+        keys.fetched_at -= 120
+        with mock.patch.object(keys, 'load', side_effect=OSError('key server down')) as load:
+            self.assertEqual(keys.get('k1')['n'], 'n1')
+            self.assertEqual(keys.get('k1')['n'], 'n1')
+            self.assertEqual(load.call_count, 1)
+        self.assertTrue(keys.stats()['fetch_failed'])
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, n, e = generate_signing_key()
+        handle, cls.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        write_key_set(cls.path, [{'kid': 'test', 'n': b64_uint(n), 'e': b64_uint(e)}])
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.path)
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        patches = [
+            mock.patch.object(auth, 'jwks', KeyStore(path=self.path)),
+            mock.patch.object(auth, 'verified_tokens', TokenCache(10)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def token(self, permissions, expires_in=60):
+        return jwt.encode({
+            'iss': 'https://%s/' % auth.AUTH0_DOMAIN,
+            'aud': auth.API_AUDIENCE,
+            'exp': int(time.time()) + expires_in,
+            'permissions': permissions
+        }, self.pem, algorithm='RS256', headers={'kid': 'test'})
+
+    def call(self, view, token):
+        with self.app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+            return view()
+
+    def test_verified_token_cached(self):
+        view = requires_auth('get:drinks-detail')(lambda payload: payload['permissions'])
+        token = self.token(['get:drinks-detail'])
+        self.assertEqual(self.call(view, token), ['get:drinks-detail'])
+        with mock.patch.object(auth, 'verify_decode_jwt') as verify:
+            self.assertEqual(self.call(view, token), ['get:drinks-detail'])
+            verify.assert_not_called()
+        stats = auth.cache_stats()
+        self.assertEqual((stats['token_cache']['hits'], stats['jwks']['keys']), (1, 1))
+
+    def test_cached_token_still_checked(self):
+        view = requires_auth(all_of('get:drinks-detail', 'post:drinks'))(lambda payload: True)
+        token = self.token(['get:drinks-detail'])
+        for _ in range(2):
+            with self.assertRaises(AuthError) as error:
+                self.call(view, token)
+            self.assertEqual(error.exception.status_code, 403)
+
+    def test_expired_token_rejected(self):
+        view = requires_auth('get:drinks-detail')(lambda payload: True)
+        with self.assertRaises(AuthError) as error:
+            self.call(view, self.token(['get:drinks-detail'], expires_in=-60))
+        self.assertEqual(error.exception.error['code'], 'token_expired')
+
+
+class MenuTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        setup_db(self.app)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.menu = Menu()
+        self.app.add_url_rule('/drinks', 'drinks', lambda: self.menu.response('short'))
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        Drink(title='Water', recipe=[{'color': 'blue', 'name': 'water', 'parts': 1}]).insert()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_etag_not_modified(self):
+        res = self.client.get('/drinks')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['drinks'][0]['title'], 'Water')
+        res = self.client.get('/drinks', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/drinks').headers['ETag']
+        Drink(title='Milk', recipe=[{'color': 'white', 'name': 'milk', 'parts': 1}]).insert()
+        res = self.client.get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(len(json.loads(res.data)['drinks']), 2)
+
+
+    def test_write_by_another_process_changes_etag(self):
+        etag = self.client.get('/drinks').headers['ETag']
+        # another worker's write never reaches this process's session events
+        with db.engine.begin() as connection:
+            connection.execute(Drink.__table__.insert(), {
+                'title': 'Tea', 'short_recipe': '[]', 'long_recipe': '[]'})
+            bump_version(connection)
+        res = self.client.get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Tea', [drink['title'] for drink in json.loads(res.data)['drinks']])
+
+    def test_rolled_back_write_keeps_etag(self):
+        etag = self.client.get('/drinks').headers['ETag']
+        db.session.add(Drink(title='Milk', recipe=[{'color': 'white', 'name': 'milk', 'parts': 1}]))
+        db.session.flush()
+        db.session.rollback()
+        res = self.client.get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()